@@ -1,11 +1,83 @@
+import hashlib
+import json
+import os
 import random
+import time
+from collections import OrderedDict
+from threading import Lock
 from liststack import *
+from fixed_base import FixedBaseTable
+from prime_search import find_safe_prime, is_prime
+
+# RFC 3526 MODP groups, p = 2q + 1 with q prime and generator g = 2 of order q
+MODP_GROUPS = {
+    'modp2048': ('''
+    FFFFFFFF FFFFFFFF C90FDAA2 2168C234 C4C6628B 80DC1CD1 29024E08 8A67CC74
+    020BBEA6 3B139B22 514A0879 8E3404DD EF9519B3 CD3A431B 302B0A6D F25F1437
+    4FE1356D 6D51C245 E485B576 625E7EC6 F44C42E9 A637ED6B 0BFF5CB6 F406B7ED
+    EE386BFB 5A899FA5 AE9F2411 7C4B1FE6 49286651 ECE45B3D C2007CB8 A163BF05
+    98DA4836 1C55D39A 69163FA8 FD24CF5F 83655D23 DCA3AD96 1C62F356 208552BB
+    9ED52907 7096966D 670C354E 4ABC9804 F1746C08 CA18217C 32905E46 2E36CE3B
+    E39E772C 180E8603 9B2783A2 EC07A28F B5C55DF0 6F4C52C9 DE2BCBF6 95581718
+    3995497C EA956AE5 15D22618 98FA0510 15728E5A 8AACAA68 FFFFFFFF FFFFFFFF
+    ''', 2),
+    'modp3072': ('''
+    FFFFFFFF FFFFFFFF C90FDAA2 2168C234 C4C6628B 80DC1CD1 29024E08 8A67CC74
+    020BBEA6 3B139B22 514A0879 8E3404DD EF9519B3 CD3A431B 302B0A6D F25F1437
+    4FE1356D 6D51C245 E485B576 625E7EC6 F44C42E9 A637ED6B 0BFF5CB6 F406B7ED
+    EE386BFB 5A899FA5 AE9F2411 7C4B1FE6 49286651 ECE45B3D C2007CB8 A163BF05
+    98DA4836 1C55D39A 69163FA8 FD24CF5F 83655D23 DCA3AD96 1C62F356 208552BB
+    9ED52907 7096966D 670C354E 4ABC9804 F1746C08 CA18217C 32905E46 2E36CE3B
+    E39E772C 180E8603 9B2783A2 EC07A28F B5C55DF0 6F4C52C9 DE2BCBF6 95581718
+    3995497C EA956AE5 15D22618 98FA0510 15728E5A 8AAAC42D AD33170D 04507A33
+    A85521AB DF1CBA64 ECFB8504 58DBEF0A 8AEA7157 5D060C7D B3970F85 A6E1E4C7
+    ABF5AE8C DB0933D7 1E8C94E0 4A25619D CEE3D226 1AD2EE6B F12FFA06 D98A0864
+    D8760273 3EC86A64 521F2B18 177B200C BBE11757 7A615D6C 770988C0 BAD946E2
+    08E24FA0 74E5AB31 43DB5BFC E0FD108E 4B82D120 A93AD2CA FFFFFFFF FFFFFFFF
+    ''', 2),
+    'modp4096': ('''
+    FFFFFFFF FFFFFFFF C90FDAA2 2168C234 C4C6628B 80DC1CD1 29024E08 8A67CC74
+    020BBEA6 3B139B22 514A0879 8E3404DD EF9519B3 CD3A431B 302B0A6D F25F1437
+    4FE1356D 6D51C245 E485B576 625E7EC6 F44C42E9 A637ED6B 0BFF5CB6 F406B7ED
+    EE386BFB 5A899FA5 AE9F2411 7C4B1FE6 49286651 ECE45B3D C2007CB8 A163BF05
+    98DA4836 1C55D39A 69163FA8 FD24CF5F 83655D23 DCA3AD96 1C62F356 208552BB
+    9ED52907 7096966D 670C354E 4ABC9804 F1746C08 CA18217C 32905E46 2E36CE3B
+    E39E772C 180E8603 9B2783A2 EC07A28F B5C55DF0 6F4C52C9 DE2BCBF6 95581718
+    3995497C EA956AE5 15D22618 98FA0510 15728E5A 8AAAC42D AD33170D 04507A33
+    A85521AB DF1CBA64 ECFB8504 58DBEF0A 8AEA7157 5D060C7D B3970F85 A6E1E4C7
+    ABF5AE8C DB0933D7 1E8C94E0 4A25619D CEE3D226 1AD2EE6B F12FFA06 D98A0864
+    D8760273 3EC86A64 521F2B18 177B200C BBE11757 7A615D6C 770988C0 BAD946E2
+    08E24FA0 74E5AB31 43DB5BFC E0FD108E 4B82D120 A9210801 1A723C12 A787E6D7
+    88719A10 BDBA5B26 99C32718 6AF4E23C 1A946834 B6150BDA 2583E9CA 2AD44CE8
+    DBBBC2DB 04DE8EF9 2E8EFC14 1FBECAA6 287C5947 4E6BC05D 99B2964F A090C3A2
+    233BA186 515BE7ED 1F612970 CEE2D7AF B81BDD76 2170481C D0069127 D5B05AA9
+    93B4EA98 8D8FDDC1 86FFB7DC 90A6C08F 4DF435C9 34063199 FFFFFFFF FFFFFFFF
+    ''', 2),
+}
+
+
+class _GroupValue:
+    """
+    :class attribute read from the lazily loaded group
+    """
+    def __init__(self, index:int) -> None:
+        self.index = index
+
+    def __get__(self, obj, owner) -> int:
+        return owner.load_group()[self.index]
+
 
 class ELGamal:
 
-    #p_value = random.getrandbits(8192)
-    p_value = random.getrandbits(1024)
-    g = 2
+    # group parameters are loaded on first use, not at import
+    group_name = 'modp2048'
+    group_path = None
+    table_window = 4
+    _group = None
+    p_value = _GroupValue(0)
+    g = _GroupValue(1)
+    # ISO/IEC 7816-4 padding marker for the block mode
+    pad_marker = b'\x80'
 
     def __init__(self, name:str) -> None:
         """
@@ -13,7 +85,76 @@ class ELGamal:
         """
         self.name = name
         self.private_key = ELGamal.generate_key()
-        self.public_key = self.power(ELGamal.g, self.private_key, ELGamal.p_value)
+        self.public_key = ELGamal.g_power(self.private_key)
+
+    @classmethod
+    def select_group(cls, name:str='modp2048', path:str=None) -> None:
+        """
+        :select standard group by name or custom group cached in path,
+        :takes effect on next use
+        """
+        if path is None and name not in MODP_GROUPS:
+            raise ValueError(f'unknown group, expected one of {list(MODP_GROUPS)}')
+        cls.group_name = name
+        cls.group_path = path
+        cls._group = None
+
+    @classmethod
+    def load_group(cls) -> tuple:
+        """
+        :(p, g, fixed-base table for g) of the selected group
+        """
+        if cls._group is None:
+            if cls.group_path is None:
+                p_hex, g = MODP_GROUPS[cls.group_name]
+                p = int(''.join(p_hex.split()), 16)
+            else:
+                with open(cls.group_path, 'r', encoding='utf-8') as file:
+                    group = json.load(file)
+                p, g = group['p'], group['g']
+                if not cls.validate_group(p, g):
+                    raise ValueError(f'invalid group in {cls.group_path}')
+            cls._group = (p, g, FixedBaseTable(g, p, p.bit_length(), cls.table_window))
+        return cls._group
+
+    @staticmethod
+    def validate_group(p:int, g:int) -> bool:
+        """
+        :p is a safe prime and g generates the subgroup of prime order (p - 1) / 2
+        """
+        return (is_prime(p) and is_prime((p - 1) // 2)
+                and 1 < g < p - 1 and pow(g, (p - 1) // 2, p) == 1)
+
+    @classmethod
+    def generate_group(cls, bits:int, path:str) -> None:
+        """
+        :generate custom safe-prime group, cache it in path and select it
+        """
+        p = find_safe_prime(bits)
+        # 4 = 2^2 is a quadratic residue, so it has order (p - 1) / 2
+        group = {'p': p, 'g': 4}
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(group, file)
+        os.replace(tmp_path, path)
+        cls.select_group('custom', path)
+
+    @classmethod
+    def use_custom_group(cls, bits:int, path:str) -> None:
+        """
+        :select group cached in path, generating it first if missing
+        """
+        if not os.path.exists(path):
+            cls.generate_group(bits, path)
+        else:
+            cls.select_group('custom', path)
+
+    @staticmethod
+    def g_power(key:int) -> int:
+        """
+        :g^key mod p with the fixed-base table of the group
+        """
+        return ELGamal.load_group()[2].pow(key)
 
     @staticmethod
     def generate_key():
@@ -61,7 +202,7 @@ class ELGamal:
         """
         key = ELGamal.generate_key() # random integer
         g_aa = self.power(public_key, key, ELGamal.p_value)
-        open_key = self.power(ELGamal.g, key, ELGamal.p_value)
+        open_key = ELGamal.g_power(key)
         text_key = [ord(msg[i])* g_aa for i in range(len(msg))]
 
         return text_key, open_key
@@ -77,7 +218,180 @@ class ELGamal:
             string += chr(int(item // back_key))
         return string
 
+    @staticmethod
+    def block_sizes():
+        """
+        :message bytes per block and width of one element mod p
+        """
+        bits = ELGamal.p_value.bit_length()
+        return (bits - 1) // 8, (bits + 7) // 8
+
+    def encryption_blocks(self, public_key:int, msg:str) -> bytes:
+        """
+        :block mode encryption, many bytes per element mod p
+        :layout: open key followed by the blocks, every value has the width of p
+        """
+        key = ELGamal.generate_key()
+        g_aa = self.power(public_key, key, ELGamal.p_value)
+        open_key = ELGamal.g_power(key)
+        return ELGamal.seal_blocks(g_aa, open_key, msg)
 
+    @staticmethod
+    def seal_blocks(g_aa:int, open_key:int, msg:str) -> bytes:
+        """
+        :block mode encryption with an already derived shared value
+        """
+        size, width = ELGamal.block_sizes()
+        data = msg.encode('utf-8') + ELGamal.pad_marker
+        data += bytes(-len(data) % size)
+        blocks = [open_key.to_bytes(width, 'big')]
+        for i in range(0, len(data), size):
+            block = int.from_bytes(data[i : i + size], 'big')
+            blocks.append((block * g_aa % ELGamal.p_value).to_bytes(width, 'big'))
+        return b''.join(blocks)
+
+    def decryption_blocks(self, cipher:bytes) -> str:
+        """
+        :block mode decryption, one modular inverse per message
+        """
+        open_key = ELGamal.open_key_of(cipher)
+        back_key = self.power(open_key, self.private_key, ELGamal.p_value)
+        return ELGamal.open_blocks(pow(back_key, -1, ELGamal.p_value), cipher)
+
+    @staticmethod
+    def open_key_of(cipher:bytes) -> int:
+        """
+        :open key of a block mode ciphertext
+        """
+        size, width = ELGamal.block_sizes()
+        if len(cipher) < 2 * width or len(cipher) % width:
+            raise ValueError('invalid ciphertext length')
+        return int.from_bytes(cipher[:width], 'big')
+
+    @staticmethod
+    def open_blocks(inverse:int, cipher:bytes) -> str:
+        """
+        :block mode decryption with the inverse of an already derived shared value
+        """
+        size, width = ELGamal.block_sizes()
+        data = b''.join(
+            (int.from_bytes(cipher[i : i + width], 'big') * inverse % ELGamal.p_value).to_bytes(size, 'big')
+            for i in range(width, len(cipher), width))
+        data = data.rstrip(b'\x00')
+        if not data.endswith(ELGamal.pad_marker):
+            raise ValueError('invalid padding')
+        return data[:-len(ELGamal.pad_marker)].decode('utf-8')
+
+
+class ELGamalSession:
+    """
+    Session layer for a chat participant caching per-peer shared values.
+
+    Derived values are kept in a bounded LRU keyed by the fingerprint of
+    (peer public key, ephemeral key). With reuse_messages > 1 one ephemeral
+    key per peer is used for that many messages or reuse_seconds seconds,
+    so chatty peers skip both exponentiations on each side.
+    """
+    def __init__(self, user:ELGamal, capacity:int=256, reuse_messages:int=1,
+                 reuse_seconds:float=None) -> None:
+        if capacity < 1 or reuse_messages < 1:
+            raise ValueError('capacity and reuse_messages must be positive')
+        self.user = user
+        self.capacity = capacity
+        self.reuse_messages = reuse_messages
+        self.reuse_seconds = reuse_seconds
+        self._shared = OrderedDict()
+        self._ephemeral = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused = 0
+
+    @staticmethod
+    def fingerprint(public_key:int, open_key:int) -> bytes:
+        """
+        :short digest identifying (peer public key, ephemeral key)
+        """
+        return hashlib.sha256(b'%x:%x' % (public_key, open_key)).digest()[:16]
+
+    def _remember(self, cache:OrderedDict, key, value) -> None:
+        """
+        :insert into LRU cache, evicting the least recently used entry
+        """
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.capacity:
+            cache.popitem(last=False)
+            self.evictions += 1
+
+    def _encryption_key(self, public_key:int) -> tuple:
+        """
+        :(shared value, open key) for the next message to the peer
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._ephemeral.get(public_key)
+            if entry is not None:
+                g_aa, open_key, uses, created = entry
+                fresh = self.reuse_seconds is None or now - created < self.reuse_seconds
+                if uses < self.reuse_messages and fresh:
+                    self._ephemeral[public_key] = (g_aa, open_key, uses + 1, created)
+                    self._ephemeral.move_to_end(public_key)
+                    self.reused += 1
+                    return g_aa, open_key
+
+        key = ELGamal.generate_key()
+        g_aa = self.user.power(public_key, key, ELGamal.p_value)
+        open_key = ELGamal.g_power(key)
+        if self.reuse_messages > 1:
+            with self._lock:
+                self._remember(self._ephemeral, public_key, (g_aa, open_key, 1, now))
+        return g_aa, open_key
+
+    def encryption_blocks(self, public_key:int, msg:str) -> bytes:
+        """
+        :block mode encryption for the peer
+        """
+        g_aa, open_key = self._encryption_key(public_key)
+        return ELGamal.seal_blocks(g_aa, open_key, msg)
+
+    def decryption_blocks(self, cipher:bytes, public_key:int=0) -> str:
+        """
+        :block mode decryption of a message from the peer with given public key
+        """
+        open_key = ELGamal.open_key_of(cipher)
+        fingerprint = ELGamalSession.fingerprint(public_key, open_key)
+        with self._lock:
+            inverse = self._shared.get(fingerprint)
+            if inverse is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._shared.move_to_end(fingerprint)
+        if inverse is None:
+            back_key = self.user.power(open_key, self.user.private_key, ELGamal.p_value)
+            inverse = pow(back_key, -1, ELGamal.p_value)
+            with self._lock:
+                self._remember(self._shared, fingerprint, inverse)
+        return ELGamal.open_blocks(inverse, cipher)
+
+    def stats(self) -> dict:
+        """
+        :cache counters
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'reused': self.reused, 'size': len(self._shared),
+                    'capacity': self.capacity}
+
+    def clear(self) -> None:
+        """
+        :forget all cached values
+        """
+        with self._lock:
+            self._shared.clear()
+            self._ephemeral.clear()
 
 
 # Alica = ELGamal("Alice")
@@ -1,11 +1,36 @@
-import random
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from sympy import isprime
-class RabinCryptosystem:
+from prime_search import find_prime
+
+
+def decrypt_chunk(rabin, chunk, block):
+    # runs in a worker, rabin is a copy holding only the key
+    decrypt = rabin.decrypt_block if block else rabin.decrypt
+    return [decrypt(c) for c in chunk]
 
-    def __init__(self) -> None:
+
+class RabinCryptosystem:
+    # redundancy appended to every plaintext block in the block mode,
+    # only the right square root ends with it
+    block_marker = b'\x5a\xa5' * 4
+    # ISO/IEC 7816-4 padding of the last block
+    pad_marker = b'\x80'
+    # decrypt_many processes smaller batches in the calling process
+    parallel_threshold = 256
+    chunk_size = 64
+
+    def __init__(self, prime_pool=None) -> None:
+        self.prime_pool = prime_pool
         self.N = None
         self._p = None
         self._q = None
+        self._exp_p = None
+        self._exp_q = None
+        self._yp_p = None
+        self._yq_q = None
 
     def generate_key(self, bit_length):
         p = self.blum_prime(bit_length // 2)
@@ -16,11 +41,20 @@ class RabinCryptosystem:
 
         self.N = N
 
+        # everything decrypt needs apart from c itself
+        # mp = C^((p+1)/4) mod p, mq = C^((q+1)/4) mod q, yp * p + yq * q = 1
+        self._exp_p = (p + 1) // 4
+        self._exp_q = (q + 1) // 4
+        gcd, yp, yq = self.extended_gcd(p, q)
+        self._yp_p = yp * p % N
+        self._yq_q = yq * q % N
+
     def blum_prime(self, bit_length):
-        while True:
-            p = random.randint(2**(bit_length-1), 2**bit_length)
-            if p % 4 == 3 and RabinCryptosystem.is_prime(p) and (p != self._p):
-                return p
+        get_prime = find_prime if self.prime_pool is None else self.prime_pool.get
+        p = get_prime(bit_length, 'blum')
+        while p == self._p:
+            p = get_prime(bit_length, 'blum')
+        return p
 
     @staticmethod
     def is_prime(n):
@@ -42,34 +76,121 @@ class RabinCryptosystem:
             gcd, x, y = self.extended_gcd(b, a % b)
             return gcd, y, x - (a // b) * y
 
-    def decrypt(self, c):
-        #mp = C(p+1)/4 mod p
-        #mq = C(q+1)/4 mod q
-        mp = pow(c, (self._p + 1) // 4, self._p)
-        mq = pow(c, (self._q + 1) // 4, self._q)
-
-        gcd, yp, yq = self.extended_gcd(self._p, self._q)
-
-        r1 = (yp * self._p * mq + yq * self._q * mp ) % self.N
-        r2 = self.N - r1
-        r3 = (yp * self._p * mq - yq * self._q * mp) % self.N
-        r4 = self.N - r3
+    def square_roots(self, c):
+        mp = pow(c % self._p, self._exp_p, self._p)
+        mq = pow(c % self._q, self._exp_q, self._q)
 
+        r1 = (self._yp_p * mq + self._yq_q * mp) % self.N
+        r3 = (self._yp_p * mq - self._yq_q * mp) % self.N
+        return r1, self.N - r1, r3, self.N - r3
 
-        binary_roots = [bin(i)[2:] for i in [r1, r2, r3, r4]]
-
-        for binary in binary_roots:
-            half_length = len(binary) // 2
-            left_half = binary[:half_length]
-            right_half = binary[half_length:]
-
-            if left_half == right_half:
-                decimal = int(left_half, 2)
-                return chr(decimal)
+    def decrypt(self, c):
+        for root in self.square_roots(c):
+            # the right root is the character code written twice in binary
+            length = root.bit_length()
+            half = root >> (length // 2)
+            if length % 2 == 0 and root - (half << (length // 2)) == half:
+                return chr(half)
 
     def encrypt_message(self, message):
         return [self.encrypt(element) for element in message]
 
-    def decrypt_message(self, code):
-        return ''.join(self.decrypt(num) for num in code)
+    def decrypt_message(self, code, workers=1):
+        return ''.join(self.decrypt_many(code, block=False, workers=workers))
+
+    def block_size(self):
+        # message bytes per block, block and marker together stay below N
+        return (self.N.bit_length() - 1) // 8 - len(self.block_marker)
+
+    def encrypt_block(self, block):
+        m = int.from_bytes(block + self.block_marker, 'big')
+        return m * m % self.N
+
+    def decrypt_block(self, c):
+        marker = int.from_bytes(self.block_marker, 'big')
+        mask = (1 << 8 * len(self.block_marker)) - 1
+        width = self.block_size() + len(self.block_marker)
+        for root in self.square_roots(c):
+            if root & mask == marker and root.bit_length() <= 8 * width:
+                return (root >> 8 * len(self.block_marker)).to_bytes(self.block_size(), 'big')
+        raise ValueError('no square root carries the block marker')
+
+    def encrypt_blocks(self, message):
+        # block mode: many UTF-8 bytes per ciphertext instead of one character
+        data = message.encode('utf-8')
+        size = self.block_size()
+        data += self.pad_marker
+        data += bytes(-len(data) % size)
+        return [self.encrypt_block(data[i : i + size]) for i in range(0, len(data), size)]
+
+    def unpad(self, data):
+        data = data.rstrip(b'\x00')
+        if not data.endswith(self.pad_marker):
+            raise ValueError('invalid padding')
+        return data[:-len(self.pad_marker)].decode('utf-8')
+
+    def decrypt_blocks(self, code, workers=1):
+        return self.unpad(b''.join(self.decrypt_many(code, workers=workers)))
+
+    def ciphertext_size(self):
+        return (self.N.bit_length() + 7) // 8
+
+    def pack_ciphertexts(self, code):
+        # fixed-width big-endian binary buffer accepted by decrypt_many
+        width = self.ciphertext_size()
+        return b''.join(c.to_bytes(width, 'big') for c in code)
+
+    def unpack_ciphertexts(self, buffer):
+        width = self.ciphertext_size()
+        view = memoryview(buffer).cast('B')
+        if len(view) % width:
+            raise ValueError('buffer size is not a multiple of the ciphertext size')
+        for i in range(0, len(view), width):
+            yield int.from_bytes(view[i : i + width], 'big')
+
+    def key_copy(self):
+        # picklable copy without the prime pool for worker processes
+        rabin = RabinCryptosystem()
+        rabin.__dict__.update(self.__dict__, prime_pool=None)
+        return rabin
+
+    def decrypt_many(self, ciphertexts, block=True, workers=None, executor=None):
+        """
+        Decrypt a batch of ciphertexts, yielding the results in order.
+
+        ciphertexts is any iterable of ints (list, array, generator) or a
+        bytes-like buffer in the pack_ciphertexts layout. Each item yields
+        decrypt_block(c) in the block mode, decrypt(c) otherwise.
+        Batches of at least parallel_threshold items are spread over
+        executor, or a process pool of workers processes if it is not given,
+        with at most two chunks per worker in flight.
+        """
+        if isinstance(ciphertexts, (bytes, bytearray, memoryview)):
+            ciphertexts = self.unpack_ciphertexts(ciphertexts)
+        items = iter(ciphertexts)
+        head = list(islice(items, self.parallel_threshold))
+        workers = workers or os.cpu_count()
+        if len(head) < self.parallel_threshold or (executor is None and workers <= 1):
+            decrypt = self.decrypt_block if block else self.decrypt
+            for code in chain(head, items):
+                yield decrypt(code)
+            return
+
+        owned = executor is None
+        if owned:
+            executor = ProcessPoolExecutor(workers)
+        rabin = self.key_copy()
+        chunks = iter(lambda: list(islice(items, self.chunk_size)), [])
+        pending = deque(executor.submit(decrypt_chunk, rabin, head[i : i + self.chunk_size], block)
+                        for i in range(0, len(head), self.chunk_size))
+        try:
+            while pending:
+                for chunk in islice(chunks, max(0, 2 * workers - len(pending))):
+                    pending.append(executor.submit(decrypt_chunk, rabin, chunk, block))
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            if owned:
+                executor.shutdown()
 
@@ -0,0 +1,529 @@
+"""
+Benchmarks for the encryption algorithms on the file*.txt corpora.
+
+Usage: python benchmarks.py [name ...]
+Without arguments every benchmark is run.
+"""
+import os
+import random
+import resource
+import sys
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from dsa import DSA
+from ecc_algo import ECC, ECCSession, MODES, User
+from ElGamal import ELGamal, ELGamalSession
+from prime_pool import PrimePool
+from prime_search import find_prime
+from RabinCryptosystem import RabinCryptosystem
+from rsa_algorithm import RSA
+
+# corpus files are looked up next to this script, whatever the working directory
+ROOT = Path(__file__).resolve().parent
+CORPORA = ['file10.txt', 'file30.txt', 'file50.txt', 'file100.txt', 'file200.txt']
+
+
+def read_corpus(path: str):
+    """
+    Read a corpus file as text.
+
+    Parameters
+    ----------
+    path : str
+        path to the file, relative to the repository root
+
+    Returns
+    -------
+    str
+        file contents
+    """
+    with open(ROOT / path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def timed(func, *args, **kwargs):
+    """
+    Call function and measure its wall time.
+
+    Returns
+    -------
+    tuple
+        result of the call and elapsed seconds
+    """
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def bench_rsa_crt():
+    """
+    Compare plain pow(c, d, n) decryption with CRT decryption.
+    """
+    r_s_a = RSA()
+    r_s_a.calculate_keys()
+    public_key = (r_s_a.encrypt_int, r_s_a.exp)
+    plain_key = (r_s_a.encrypt_int, r_s_a.decrypt_int)
+    print(f"{'corpus':<12}{'blocks':>8}{'plain, s':>12}{'crt, s':>12}{'speedup':>10}")
+    for path in CORPORA:
+        encrypted = r_s_a.encrypt(read_corpus(path), public_key)
+        plain, plain_time = timed(r_s_a.decrypt, encrypted, plain_key)
+        crt, crt_time = timed(r_s_a.decrypt, encrypted, r_s_a.private_key)
+        assert plain == crt
+        print(f"{path:<12}{encrypted.count(' ') + 1:>8}{plain_time:>12.3f}"
+              f"{crt_time:>12.3f}{plain_time / crt_time:>9.2f}x")
+
+
+def bench_rsa_multiprime(rounds: int = 5):
+    """
+    Compare key generation and CRT decryption for 2, 3 and 4 prime moduli.
+    """
+    message = read_corpus('file10.txt')
+    print(f"{'primes':<8}{'keygen, s':>12}{'decrypt, s':>12}")
+    for primes in (2, 3, 4):
+        r_s_a = RSA(primes=primes)
+        keygen_time = sum(timed(r_s_a.calculate_keys)[1] for _ in range(rounds)) / rounds
+        encrypted = r_s_a.encrypt(message, (r_s_a.encrypt_int, r_s_a.exp))
+        _, decrypt_time = timed(r_s_a.decrypt, encrypted, r_s_a.private_key)
+        print(f"{primes:<8}{keygen_time:>12.3f}{decrypt_time:>12.3f}")
+
+
+def bench_rsa_packed(path: str = 'file200.txt'):
+    """
+    Compare throughput of the decimal and byte-packed block encodings.
+    """
+    r_s_a = RSA()
+    r_s_a.calculate_keys()
+    public_key = (r_s_a.encrypt_int, r_s_a.exp)
+    message = read_corpus(path)
+    size = len(message.encode('utf-8')) / 2 ** 20
+    print(f"{'mode':<10}{'cipher, KB':>12}{'enc, MB/s':>12}{'dec, MB/s':>12}")
+    for packed in (False, True):
+        encrypted, enc_time = timed(r_s_a.encrypt, message, public_key, packed=packed)
+        _, dec_time = timed(r_s_a.decrypt, encrypted, r_s_a.private_key)
+        print(f"{'packed' if packed else 'decimal':<10}{len(encrypted) / 1024:>12.1f}"
+              f"{size / enc_time:>12.3f}{size / dec_time:>12.3f}")
+
+
+def bench_rsa_bulk(path: str = 'file200.txt'):
+    """
+    Measure scaling of packed bulk encryption/decryption with worker count,
+    one process pool per worker count reused by both directions.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    r_s_a = RSA()
+    r_s_a.calculate_keys()
+    public_key = (r_s_a.encrypt_int, r_s_a.exp)
+    message = read_corpus(path)
+    size = len(message.encode('utf-8')) / 2 ** 20
+    print(f"{'workers':<10}{'enc, MB/s':>12}{'dec, MB/s':>12}")
+    workers = 1
+    while workers <= os.cpu_count():
+        with ProcessPoolExecutor(workers) as executor:
+            encrypted, enc_time = timed(r_s_a.encrypt_bulk, message, public_key, workers,
+                                        executor)
+            decrypted, dec_time = timed(r_s_a.decrypt_bulk, encrypted, r_s_a.private_key,
+                                        workers, executor)
+        assert decrypted == message
+        print(f"{workers:<10}{size / enc_time:>12.3f}{size / dec_time:>12.3f}")
+        workers *= 2
+
+
+def bench_prime_pool(keys: int = 10, warmup: float = 10.0):
+    """
+    Compare key generation latency with and without a warmed-up prime pool.
+    """
+    from time import sleep
+
+    def generate(pool):
+        r_s_a = RSA(prime_pool=pool)
+        rabin = RabinCryptosystem(prime_pool=pool)
+        d_s_a = DSA(prime_pool=pool)
+        return (timed(r_s_a.calculate_keys)[1], timed(rabin.generate_key, 1024)[1],
+                timed(d_s_a.select_prime_divisor, 160)[1])
+
+    print(f"{'mode':<8}{'rsa, ms':>10}{'rabin, ms':>11}{'dsa q, ms':>11}")
+    with PrimePool() as pool:
+        pool.reserve(512, low_water=2 * keys)
+        pool.reserve(512, 'blum', low_water=2 * keys)
+        pool.reserve(160, low_water=keys)
+        sleep(warmup)
+        for name, source in (('direct', None), ('pool', pool)):
+            times = [generate(source) for _ in range(keys)]
+            print(f"{name:<8}" + ''.join(f"{1000 * sum(col) / keys:>{width}.2f}"
+                                         for col, width in zip(zip(*times), (10, 11, 11))))
+        for key, counters in pool.stats().items():
+            print(key, counters)
+
+
+def bench_prime_search(rounds: int = 5):
+    """
+    Compare the sieve-based prime search with the random-restart loops
+    previously used by RabinCryptosystem.blum_prime and DSA.select_prime_divisor.
+    """
+    d_s_a = DSA()
+
+    def restart_blum(bits):
+        while True:
+            prime = random.randint(2 ** (bits - 1), 2 ** bits)
+            if prime % 4 == 3 and RabinCryptosystem.is_prime(prime):
+                return prime
+
+    def restart_dsa(bits):
+        while True:
+            prime = random.randrange(2 ** (bits - 1), 2 ** bits)
+            if d_s_a.is_prime(prime):
+                return prime
+
+    # the old DSA loop runs a full Miller-Rabin pass per candidate,
+    # which is too slow to be measured at 2048 bits
+    cases = [(bits, 'blum', restart_blum) for bits in (512, 1024, 2048)]
+    cases += [(bits, 'plain', restart_dsa) for bits in (160, 512, 1024)]
+    print(f"{'bits':<6}{'kind':<7}{'restart, ms':>13}{'sieve, ms':>11}{'speedup':>10}")
+    for bits, kind, restart in cases:
+        restart_time = sum(timed(restart, bits)[1] for _ in range(rounds)) / rounds
+        sieve_time = sum(timed(find_prime, bits, kind)[1] for _ in range(rounds)) / rounds
+        print(f"{bits:<6}{kind:<7}{1000 * restart_time:>13.1f}{1000 * sieve_time:>11.1f}"
+              f"{restart_time / sieve_time:>9.2f}x")
+
+
+def bench_rabin_blocks(path: str = 'file100.txt', bits: int = 1024):
+    """
+    Compare per-character and block mode Rabin encryption.
+
+    Every ciphertext costs one squaring to encrypt and two half-size
+    exponentiations to decrypt.
+    """
+    rabin = RabinCryptosystem()
+    rabin.generate_key(bits)
+    message = read_corpus(path)
+    print(f"{'mode':<8}{'ciphertexts':>13}{'modular ops':>13}{'enc, s':>9}{'dec, s':>9}")
+    for mode, encrypt, decrypt in (('char', rabin.encrypt_message, rabin.decrypt_message),
+                                   ('block', rabin.encrypt_blocks, rabin.decrypt_blocks)):
+        code, enc_time = timed(encrypt, message)
+        decrypted, dec_time = timed(decrypt, code)
+        assert decrypted == message
+        print(f"{mode:<8}{len(code):>13}{3 * len(code):>13}{enc_time:>9.3f}{dec_time:>9.3f}")
+
+
+def bench_rabin_many(path: str = 'file10.txt', bits: int = 1024):
+    """
+    Measure batched per-character Rabin decryption with worker count.
+    """
+    rabin = RabinCryptosystem()
+    rabin.generate_key(bits)
+    message = read_corpus(path)
+    code = rabin.encrypt_message(message)
+    print(f"{'workers':<10}{'items/s':>10}")
+    workers = 1
+    while workers <= os.cpu_count():
+        decrypted, dec_time = timed(rabin.decrypt_message, code, workers)
+        assert decrypted == message
+        print(f"{workers:<10}{len(code) / dec_time:>10.0f}")
+        workers *= 2
+
+
+def bench_dsa_fixed_base(rounds: int = 200):
+    """
+    Compare g^k mod p with exp_square, builtin pow and the fixed-base table.
+    """
+    d_s_a = DSA()
+    d_s_a.generate_keys()
+    p_val, q_val, g_val = d_s_a._p, d_s_a._q, d_s_a._g
+    exps = [random.randint(1, q_val - 1) for _ in range(rounds)]
+    print(f"{'method':<14}{'entries':>9}{'us/exp':>10}")
+    for name, func in (('exp_square', lambda e: DSA.exp_square(g_val, e, p_val)),
+                       ('pow', lambda e: pow(g_val, e, p_val))):
+        print(f"{name:<14}{'':>9}{1e6 * timed(list, map(func, exps))[1] / rounds:>10.1f}")
+    for window in (2, 4, 6, 8):
+        d_s_a.window = window
+        _, build_time = timed(d_s_a.g_power, 1)
+        _, exp_time = timed(list, map(d_s_a.g_power, exps))
+        print(f"{'table w=' + str(window):<14}{len(d_s_a._g_table):>9}{1e6 * exp_time / rounds:>10.1f}"
+              f"  (build {1000 * build_time:.1f} ms)")
+
+
+def bench_dsa_verify_batch(count: int = 400, signers: int = 4):
+    """
+    Compare looping over DSA.verify with DSA.verify_batch.
+    """
+    d_s_a = DSA()
+    d_s_a.generate_keys()
+    keys = []
+    for _ in range(signers):
+        signer = DSA()
+        signer._p, signer._q, signer._g = d_s_a._p, d_s_a._q, d_s_a._g
+        signer._signing_key = random.randint(2, d_s_a._q - 1)
+        signer.verification_key = signer.g_power(signer._signing_key)
+        keys.append(signer)
+    items = []
+    for i in range(count):
+        signer = keys[i % signers]
+        message = f'message {i}'
+        items.append((message, signer.sign(message), signer.verification_key))
+
+    def loop():
+        return [keys[i % signers].verify(message, signature) == 'Signature is valid.'
+                for i, (message, signature, _) in enumerate(items)]
+
+    expected, loop_time = timed(loop)
+    print(f"{'method':<16}{'sig/s':>10}")
+    print(f"{'verify loop':<16}{count / loop_time:>10.0f}")
+    workers = 1
+    while workers <= os.cpu_count():
+        result, batch_time = timed(d_s_a.verify_batch, items, workers)
+        assert result == expected
+        print(f"{'batch, ' + str(workers) + ' proc':<16}{count / batch_time:>10.0f}")
+        workers *= 2
+
+
+def bench_dsa_nonce_pool(count: int = 200, depth: int = 256):
+    """
+    Compare DSA.sign latency without and with a warmed-up nonce pool.
+    """
+    from time import sleep
+
+    d_s_a = DSA()
+    d_s_a.generate_keys()
+
+    def latencies():
+        times = sorted(timed(d_s_a.sign, f'message {i}')[1] for i in range(count))
+        return 1e6 * times[count // 2], 1e6 * times[int(count * 0.99)]
+
+    print(f"{'mode':<10}{'p50, us':>10}{'p99, us':>10}")
+    print(f"{'inline':<10}" + ''.join(f'{value:>10.1f}' for value in latencies()))
+    pool = d_s_a.start_nonce_pool(depth)
+    while pool.stats()['available'] < depth:
+        sleep(0.05)
+    print(f"{'pool':<10}" + ''.join(f'{value:>10.1f}' for value in latencies()))
+    print(pool.stats())
+    d_s_a.stop_nonce_pool()
+
+
+def scaled_corpus(path: str, factor: int, directory: str):
+    """
+    Write the corpus repeated factor times into directory.
+
+    Returns
+    -------
+    pathlib.Path
+        path to the new file
+    """
+    target = Path(directory) / f'{Path(path).stem}x{factor}.txt'
+    data = (ROOT / path).read_bytes()
+    with open(target, 'wb') as file:
+        for _ in range(factor):
+            file.write(data)
+    return target
+
+
+def bench_dsa_stream(factors: tuple = (1, 10, 100, 500)):
+    """
+    Sign and verify growing files streamed from disk, with peak Python memory.
+    """
+    d_s_a = DSA()
+    d_s_a.generate_keys()
+    print(f"{'file':<20}{'MB':>8}{'sign, MB/s':>12}{'verify, MB/s':>14}{'peak, KB':>10}")
+    with TemporaryDirectory() as directory:
+        for factor in factors:
+            path = scaled_corpus('file200.txt', factor, directory)
+            size = path.stat().st_size / 2 ** 20
+            tracemalloc.start()
+            signature, sign_time = timed(d_s_a.sign, path)
+            verdict, verify_time = timed(d_s_a.verify, path, signature)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert verdict == 'Signature is valid.'
+            print(f"{path.name:<20}{size:>8.1f}{size / sign_time:>12.1f}"
+                  f"{size / verify_time:>14.1f}{peak / 1024:>10.1f}")
+            path.unlink()
+
+
+def bench_elgamal_blocks():
+    """
+    Compare ciphertext size and decryption time of the per-character
+    and block ElGamal modes.
+    """
+    alice, bob = ELGamal('Alice'), ELGamal('Bob')
+    messages = [('chat', 'See you at the meeting tomorrow at 10!'),
+                ('file10.txt', read_corpus('file10.txt'))]
+    print(f"{'message':<12}{'mode':<7}{'cipher, KB':>12}{'dec, ms':>10}")
+    for name, message in messages:
+        text_key, open_key = alice.encryption(bob.public_key, message)
+        size = sum((item.bit_length() + 7) // 8 for item in text_key)
+        _, dec_time = timed(bob.decryption, open_key, text_key)
+        print(f"{name:<12}{'char':<7}{size / 1024:>12.2f}{1000 * dec_time:>10.2f}")
+        cipher = alice.encryption_blocks(bob.public_key, message)
+        decrypted, dec_time = timed(bob.decryption_blocks, cipher)
+        assert decrypted == message
+        print(f"{name:<12}{'block':<7}{len(cipher) / 1024:>12.2f}{1000 * dec_time:>10.2f}")
+
+
+def bench_elgamal_session(count: int = 50, reuse: int = 25):
+    """
+    Per-message cost of chatty ElGamal peers with and without the session cache.
+    """
+    alice, bob = ELGamal('Alice'), ELGamal('Bob')
+    messages = [f'message number {i}' for i in range(count)]
+
+    def plain():
+        for message in messages:
+            bob.decryption_blocks(alice.encryption_blocks(bob.public_key, message))
+
+    def session():
+        sender = ELGamalSession(alice, reuse_messages=reuse)
+        receiver = ELGamalSession(bob)
+        for message in messages:
+            cipher = sender.encryption_blocks(bob.public_key, message)
+            assert receiver.decryption_blocks(cipher, alice.public_key) == message
+        return receiver.stats()
+
+    _, plain_time = timed(plain)
+    stats, session_time = timed(session)
+    print(f"{'mode':<10}{'ms/msg':>10}")
+    print(f"{'plain':<10}{1000 * plain_time / count:>10.2f}")
+    print(f"{'session':<10}{1000 * session_time / count:>10.2f}  {stats}")
+
+
+def bench_ecc_session(count: int = 200):
+    """
+    Per-message cost of ECIES with fresh ECDH + HKDF and with the session cache.
+    """
+    alice, bob = User('Alice'), User('Bob')
+    message = b'See you at the meeting tomorrow at 10!'
+
+    def fresh():
+        ecc = ECC(alice, bob)
+        for _ in range(count):
+            secret = ecc.generate_shared(alice)
+            k_enc, k_mac = ecc.generate_enc_key(secret), ecc.generate_mac_key(secret)
+            ecc.generate_tag(ecc.aes_enc(message, k_enc), k_mac)
+
+    def cached():
+        session = ECCSession(alice)
+        for _ in range(count):
+            session.encrypt(message, bob.public)
+        return session.stats()
+
+    _, fresh_time = timed(fresh)
+    stats, cached_time = timed(cached)
+    print(f"{'mode':<10}{'us/msg':>10}")
+    print(f"{'fresh':<10}{1e6 * fresh_time / count:>10.1f}")
+    print(f"{'session':<10}{1e6 * cached_time / count:>10.1f}  {stats}")
+
+
+def _ecc_stream_run(path: str):
+    """
+    Encrypt and decrypt one file with the streaming ECIES methods
+    in a fresh process, returning the timings and the peak RSS.
+    """
+    alice, bob = User('Alice'), User('Bob')
+    ecc = ECC(alice, bob)
+    secret = ecc.generate_shared(alice)
+    k_enc, k_mac = ecc.generate_enc_key(secret), ecc.generate_mac_key(secret)
+    with open(f'{path}.enc', 'wb') as sink:
+        _, enc_time = timed(ecc.encrypt_stream, path, sink, k_enc, k_mac)
+    with open(f'{path}.dec', 'wb') as sink:
+        _, dec_time = timed(ecc.decrypt_stream, f'{path}.enc', sink, k_enc, k_mac)
+    assert os.path.getsize(f'{path}.dec') == os.path.getsize(path)
+    os.remove(f'{path}.enc')
+    os.remove(f'{path}.dec')
+    return enc_time, dec_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_ecc_stream(factors: tuple = (1, 10, 100, 1000, 5000)):
+    """
+    Streaming ECIES throughput and peak RSS on file200.txt scaled up
+    to about 1 GB (factor 5000, needs three times that on the temporary disk).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    print(f"{'file':<20}{'MB':>8}{'enc, MB/s':>11}{'dec, MB/s':>11}{'peak RSS, MB':>14}")
+    with TemporaryDirectory() as directory:
+        for factor in factors:
+            path = scaled_corpus('file200.txt', factor, directory)
+            size = path.stat().st_size / 2 ** 20
+            with ProcessPoolExecutor(1) as executor:
+                enc_time, dec_time, peak = executor.submit(_ecc_stream_run, str(path)).result()
+            print(f"{path.name:<20}{size:>8.1f}{size / enc_time:>11.1f}{size / dec_time:>11.1f}"
+                  f"{peak / 1024:>14.1f}")
+            path.unlink()
+
+
+def bench_ecc_modes(sizes: tuple = (64, 1024, 16384, 262144, 4194304)):
+    """
+    Compare CBC+HMAC with the AEAD modes across message sizes,
+    encryption and decryption of one message in a cached session.
+    """
+    alice, bob = User('Alice'), User('Bob')
+    print(f"{'size, B':<10}" + ''.join(f'{mode:>20}' for mode in MODES) + '  (MB/s)')
+    for size in sizes:
+        message = os.urandom(size)
+        rounds = max(1, 2 ** 24 // size)
+        row = []
+        for mode in MODES:
+            sender, receiver = ECCSession(alice, mode=mode), ECCSession(bob, mode=mode)
+            sender.keys(bob.public)
+            receiver.keys(alice.public)
+
+            def roundtrip():
+                for _ in range(rounds):
+                    c_message, tag = sender.encrypt(message, bob.public)
+                    receiver.decrypt(c_message, tag, alice.public)
+
+            row.append(rounds * size / 2 ** 20 / timed(roundtrip)[1])
+        print(f"{size:<10}" + ''.join(f'{speed:>20.1f}' for speed in row))
+
+
+def bench_ecc_broadcast(recipients: tuple = (1, 10, 100), size: int = 65536):
+    """
+    Compare sending one message to N users one by one and as an envelope,
+    with warm per-peer key caches.
+    """
+    sender = User('Sender')
+    users = [User(f'User {i}') for i in range(max(recipients))]
+    message = os.urandom(size)
+    session = ECCSession(sender, capacity=len(users), mode='aes-gcm')
+    for user in users:
+        session.keys(user.public)
+    print(f"{'recipients':<12}{'one by one, ms':>16}{'envelope, ms':>14}{'bytes sent':>12}")
+    for count in recipients:
+        publics = [user.public for user in users[:count]]
+        sent, loop_time = timed(lambda: [session.encrypt(message, public) for public in publics])
+        envelope, envelope_time = timed(session.encrypt_envelope, message, publics)
+        receiver = ECCSession(users[count - 1])
+        assert receiver.decrypt_envelope(envelope, sender.public) == message
+        envelope_size = len(envelope[0]) + sum(len(key) + len(fp) for fp, key in envelope[1].items())
+        print(f"{count:<12}{1000 * loop_time:>16.2f}{1000 * envelope_time:>14.2f}"
+              f"{sum(len(c) + len(t) for c, t in sent):>12} -> {envelope_size}")
+
+
+BENCHMARKS = {
+    'rsa_crt': bench_rsa_crt,
+    'rsa_multiprime': bench_rsa_multiprime,
+    'rsa_packed': bench_rsa_packed,
+    'rsa_bulk': bench_rsa_bulk,
+    'prime_pool': bench_prime_pool,
+    'prime_search': bench_prime_search,
+    'rabin_blocks': bench_rabin_blocks,
+    'rabin_many': bench_rabin_many,
+    'dsa_fixed_base': bench_dsa_fixed_base,
+    'dsa_verify_batch': bench_dsa_verify_batch,
+    'dsa_nonce_pool': bench_dsa_nonce_pool,
+    'dsa_stream': bench_dsa_stream,
+    'elgamal_blocks': bench_elgamal_blocks,
+    'elgamal_session': bench_elgamal_session,
+    'ecc_session': bench_ecc_session,
+    'ecc_stream': bench_ecc_stream,
+    'ecc_modes': bench_ecc_modes,
+    'ecc_broadcast': bench_ecc_broadcast,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f'== {name} ==')
+        BENCHMARKS[name]()
@@ -2,9 +2,175 @@
 Module for Digital Signature Algorithm (DSA)
 """
 
+import json
+import mmap
+import os
 import random
-from math import gcd
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
 from Crypto.Hash import SHA256
+from fixed_base import FixedBaseTable
+from prime_search import find_prime, is_prime
+
+_worker_dsa = None
+
+
+def search_domain(q_val, p_bits, attempts):
+    """
+    Look for a prime p = k * q + 1 with exactly p_bits bits.
+
+    Parameters
+    ----------
+    q_val : int
+        prime divisor q
+    p_bits : int
+        bit length of p
+    attempts : int
+        number of random k to try
+
+    Returns
+    -------
+    int or None
+        p, or None if no attempt succeeded
+    """
+    low = -(-2 ** (p_bits - 1) // q_val)
+    high = (2 ** p_bits - 1) // q_val
+    for _ in range(attempts):
+        # k must be even for p to be odd
+        k = random.randrange(low, high + 1) & ~1
+        p_val = k * q_val + 1
+        if p_val.bit_length() == p_bits and is_prime(p_val):
+            return p_val
+    return None
+
+
+def _init_worker(p_val, q_val, g_val, window):
+    """
+    Set up the domain of a verify_batch worker process once.
+    """
+    global _worker_dsa
+    _worker_dsa = DSA(window=window)
+    _worker_dsa._p, _worker_dsa._q, _worker_dsa._g = p_val, q_val, g_val
+
+
+def _verify_chunk(items, table_threshold):
+    """
+    Verify a chunk of a batch in a worker process.
+    """
+    return _worker_dsa.verify_batch(items, table_threshold=table_threshold)
+
+
+class NoncePool:
+    """
+    Bounded pool of precomputed signing nonces (k, r, k^-1 mod q).
+
+    A background thread keeps the pool full, so online signing only
+    has to take a triple and do one multiplication.
+    """
+    def __init__(self, p_val, q_val, g_val, depth=64, rate=None, window=4) -> None:
+        """
+        Parameters
+        ----------
+        p_val, q_val, g_val : int
+            domain parameters
+        depth : int
+            maximal number of stored triples
+        rate : float or None
+            maximal number of triples computed per second, None for no limit
+        window : int
+            digit size of the fixed-base table for g
+        """
+        if depth < 1:
+            raise ValueError('depth must be positive')
+        self.domain = (p_val, q_val, g_val)
+        self.depth = depth
+        self.rate = rate
+        self._table = FixedBaseTable(g_val, p_val, q_val.bit_length(), window)
+        self._queue = Queue(maxsize=depth)
+        self._lock = Lock()
+        self._stopped = Event()
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+        self._thread = Thread(target=self._fill, name='dsa-nonce-pool', daemon=True)
+        self._thread.start()
+
+    def triple(self):
+        """
+        Compute a fresh (k, r, k^-1 mod q) triple with r != 0.
+        """
+        q_val = self.domain[1]
+        while True:
+            k = random.randint(1, q_val - 1)
+            r_val = self._table.pow(k) % q_val
+            if r_val != 0:
+                return k, r_val, pow(k, -1, q_val)
+
+    def _fill(self):
+        """
+        Background loop keeping the pool at its depth.
+        """
+        while not self._stopped.is_set():
+            started = time.perf_counter()
+            triple = self.triple()
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put(triple, timeout=0.1)
+                    break
+                except Full:
+                    continue
+            with self._lock:
+                self.produced += 1
+            if self.rate:
+                self._stopped.wait(max(0.0, 1 / self.rate - (time.perf_counter() - started)))
+
+    def get(self):
+        """
+        Take a triple, computing it inline if the pool is empty.
+
+        Returns
+        -------
+        tuple
+            (k, r, k^-1 mod q)
+        """
+        try:
+            triple = self._queue.get_nowait()
+        except Empty:
+            with self._lock:
+                self.misses += 1
+            return self.triple()
+        with self._lock:
+            self.hits += 1
+        return triple
+
+    def stats(self):
+        """
+        Usage counters.
+
+        Returns
+        -------
+        dict
+            hits, misses, produced, available, depth and rate
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'produced': self.produced,
+                    'available': self._queue.qsize(), 'depth': self.depth, 'rate': self.rate}
+
+    def stop(self):
+        """
+        Stop the background thread and drop the stored triples.
+        """
+        self._stopped.set()
+        self._thread.join()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+
 
 class DSA:
     """
@@ -23,11 +189,21 @@ class DSA:
                 389, 397, 401, 409, 419, 421, 431,
                 433, 439, 443, 449, 457, 461, 463,
                 467, 479, 487, 491, 499]
-
-    def __init__(self) -> None:
+    # verify_batch uses the process pool for batches of at least this size
+    parallel_threshold = 512
+    # candidates for p tried by one domain search job
+    domain_attempts = 64
+    # bytes hashed at once when a message is streamed
+    hash_chunk_size = 1 << 20
+
+    def __init__(self, prime_pool=None, window=4) -> None:
+        self.prime_pool = prime_pool # optional prime_pool.PrimePool
+        self.window = window # digit size of the fixed-base table for g
         self._p = None
         self._q = None
         self._g = None
+        self._g_table = None
+        self.nonce_pool = None # NoncePool for offline/online signing
         self._signing_key = None # private key
         self.verification_key = None # public key
 
@@ -78,10 +254,9 @@ class DSA:
         """
         Return a random prime number of keysize bits in size.
         """
-        while True:
-            num = random.randrange(2 ** (bits_num - 1), 2 ** (bits_num))
-            if self.is_prime(num):
-                return num
+        if self.prime_pool is not None:
+            return self.prime_pool.get(bits_num)
+        return find_prime(bits_num)
 
     # ----------------------------------------------------------------------------------
 
@@ -113,6 +288,30 @@ class DSA:
                 result = (result * base) % mod
         return result
 
+    def g_power(self, exp):
+        """
+        Compute g^exp mod p using the fixed-base table of the current domain.
+
+        The table is built on first use and rebuilt when (p, q, g)
+        or the window change.
+
+        Parameters
+        ----------
+        exp : int
+            integer
+
+        Returns
+        -------
+        int
+            Y = gˆexp mod p
+        """
+        table = self._g_table
+        domain = (self._g, self._p, self._q.bit_length(), self.window)
+        if table is None or (table.base, table.mod, table.bits, table.window) != domain:
+            table = FixedBaseTable(*domain)
+            self._g_table = table
+        return table.pow(exp)
+
     @staticmethod
     def extended_eucledian(a_val, b_val):
         """
@@ -147,31 +346,200 @@ class DSA:
         # 1 = s * a + t * b
         return (gcd_, s_a, t_b)
 
+    # Step 0: Generate domain parameters (p, q, g), shared by many key pairs.
+
+    @staticmethod
+    def validate_domain(p, q, g):
+        """
+        Check domain parameters according to the rules.
+
+        Returns
+        -------
+        bool
+            True if p and q are primes, q divides p - 1, the bit length of p
+            is a multiple of 64 between 512 and 1024 and g has order q
+        """
+        L = p.bit_length()
+        return (L >= 512 and L <= 1024 and L % 64 == 0 and (p - 1) % q == 0
+                and is_prime(q) and is_prime(p) and 1 < g < p and pow(g, q, p) == 1)
+
+    def generate_domain(self, p_bits=576, q_bits=160, workers=1):
+        """
+        Generate and set new domain parameters.
+
+        The search for p is iterative. With several workers the candidates
+        are tried in a process pool and the first prime found wins.
+
+        Parameters
+        ----------
+        p_bits : int
+            bit length of p
+        q_bits : int
+            bit length of q
+        workers : int or None
+            number of worker processes, None for os.cpu_count()
+
+        Returns
+        -------
+        tuple
+            (p, q, g)
+        """
+        if p_bits < 512 or p_bits > 1024 or p_bits % 64 != 0:
+            raise ValueError('bit length of p must be a multiple of 64 between 512 and 1024')
+        q = self.select_prime_divisor(q_bits)
+        workers = workers or os.cpu_count()
+        p = None
+        if workers <= 1:
+            while p is None:
+                p = search_domain(q, p_bits, self.domain_attempts)
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                pending = {executor.submit(search_domain, q, p_bits, self.domain_attempts)
+                           for _ in range(workers)}
+                while p is None:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        p = p or future.result()
+                        if p is None:
+                            pending.add(executor.submit(search_domain, q, p_bits,
+                                                        self.domain_attempts))
+                for future in pending:
+                    future.cancel()
+
+        g = 1
+        while g == 1:
+            t = random.randint(2, p - 2)
+            g = pow(t, (p - 1) // q, p)
+        self.set_domain(p, q, g)
+        return p, q, g
+
+    def set_domain(self, p, q, g):
+        """
+        Use the given domain parameters for new key pairs.
+        """
+        if not self.validate_domain(p, q, g):
+            raise ValueError('invalid domain parameters')
+        self._p, self._q, self._g = p, q, g
+
+    def save_domain(self, path):
+        """
+        Write domain parameters to a JSON file.
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'p': self._p, 'q': self._q, 'g': self._g}, file)
+        os.replace(tmp_path, path)
+
+    def load_domain(self, path):
+        """
+        Read and validate domain parameters from a JSON file.
+        """
+        with open(path, 'r', encoding='utf-8') as file:
+            domain = json.load(file)
+        if not isinstance(domain, dict):
+            raise ValueError('invalid domain file')
+        values = [domain.get(name) for name in ('p', 'q', 'g')]
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            raise ValueError('domain parameters must be integers')
+        self.set_domain(*values)
+
+    def use_domain(self, path, **kwargs):
+        """
+        Load cached domain parameters, generating and caching them
+        first if the file is missing or invalid.
+
+        Parameters
+        ----------
+        path : str
+            path to the cache file
+        kwargs
+            arguments of generate_domain
+        """
+        try:
+            self.load_domain(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.generate_domain(**kwargs)
+            self.save_domain(path)
+
     # Step 1: Generate public and private keys.
 
     def generate_keys(self):
         """
         Generating public and private keys according to the rules.
+
+        Domain parameters are generated first only if none are set,
+        so a new key pair in an existing domain costs one exponentiation.
         """
-        k = random.randrange(2 ** (415), 2 ** (416))
-        q = self.select_prime_divisor(160)
-        p = (k * q) + 1
-        L = p.bit_length()
-        t = random.randint(1, p - 1)
-        g = self.exp_square(t, (p-1) // q, p)
-
-        if (L >= 512 and L <= 1024 and L % 64 == 0 and (gcd(p - 1, q)) > 1 and self.exp_square(g, q, p) == 1):
-            signing_key = random.randint(2, q - 1) # private_key
-            verification_key = self.exp_square(g, signing_key, p) # public_key
-            self._signing_key = signing_key
-            self.verification_key = verification_key
-            self._p = p
-            self._q = q
-            self._g = g
-            # verification_key = [p, q, g, self.exp_square(g, signing_key, p)]
-            # self.write_keys(signing_key, verification_key)
+        if self._p is None:
+            self.generate_domain()
+        signing_key = random.randint(2, self._q - 1) # private_key
+        verification_key = self.g_power(signing_key) # public_key
+        self._signing_key = signing_key
+        self.verification_key = verification_key
+        pool = self.nonce_pool
+        if pool is not None and pool.domain != (self._p, self._q, self._g):
+            self.start_nonce_pool(pool.depth, pool.rate)
+        # verification_key = [p, q, g, self.exp_square(g, signing_key, p)]
+        # self.write_keys(signing_key, verification_key)
+
+    @classmethod
+    def message_digest(cls, message):
+        """
+        SHA-256 digest of the message as an integer.
+
+        The message is hashed incrementally with a buffer of
+        hash_chunk_size bytes, files on disk are mapped into memory,
+        so the memory used does not depend on the message size.
+
+        Parameters
+        ----------
+        message : str, bytes, os.PathLike, file object or iterable
+            string (encoded as UTF-8), bytes-like object, path to a file
+            (a str is always the message itself, use pathlib.Path for paths),
+            binary file object or iterable of str/bytes chunks
+
+        Returns
+        -------
+        int
+            digest
+        """
+        hash_obj = SHA256.new()
+        if isinstance(message, str):
+            hash_obj.update(message.encode('utf-8'))
+        elif isinstance(message, (bytes, bytearray, memoryview)):
+            hash_obj.update(message)
+        elif isinstance(message, os.PathLike):
+            with open(message, 'rb') as file:
+                cls._hash_file(hash_obj, file)
+        elif hasattr(message, 'readinto'):
+            cls._hash_file(hash_obj, message)
         else:
-            self.generate_keys()
+            for chunk in message:
+                hash_obj.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        return int.from_bytes(hash_obj.digest(), 'big')
+
+    @classmethod
+    def _hash_file(cls, hash_obj, file):
+        """
+        Update hash with the rest of a binary file, via mmap when possible.
+        """
+        try:
+            size = os.fstat(file.fileno()).st_size
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        except (AttributeError, OSError, ValueError):
+            mapped = None
+        if mapped is not None:
+            with mapped, memoryview(mapped) as view:
+                for start in range(file.tell(), len(view), cls.hash_chunk_size):
+                    hash_obj.update(view[start : start + cls.hash_chunk_size])
+            return
+        buffer = bytearray(cls.hash_chunk_size)
+        with memoryview(buffer) as view:
+            while True:
+                read = file.readinto(buffer)
+                if not read:
+                    break
+                hash_obj.update(view[:read])
 
     # Step 2: Create signature for the user with private and public keys.
 
@@ -181,23 +549,76 @@ class DSA:
 
         Parameters
         ----------
-        message : str
-            string
+        message : str, bytes, os.PathLike, file object or iterable
+            message, see message_digest
+
+        Returns
+        -------
+        tuple
+            signature as a pair of c_1 and c_2
+        """
+        return self.sign_digest(self.message_digest(message))
+
+    def sign_digest(self, digest):
+        """
+        Create signature of an already computed message digest.
+
+        Parameters
+        ----------
+        digest : int or bytes
+            SHA-256 digest of the message
 
         Returns
         -------
         tuple
             signature as a pair of c_1 and c_2
         """
+        if not isinstance(digest, int):
+            digest = int.from_bytes(digest, 'big')
+        pool = self.nonce_pool
+        if pool is not None and pool.domain != (self._p, self._q, self._g):
+            pool = None
         while True:
-            random_elem = random.randint(1, self._q - 1)
-            c_1 = self.exp_square(self._g, random_elem, self._p) % self._q
-            gcd_ = self.extended_eucledian(random_elem, self._q)[1]
-            c_2 = (int("0x" + SHA256.new(message.encode('ascii')).hexdigest(), 0) + self._signing_key * c_1) * gcd_ % self._q
+            if pool is not None:
+                # offline part is done by the pool: c_1 = g^k mod p mod q, gcd_ = k^-1 mod q
+                _, c_1, gcd_ = pool.get()
+            else:
+                random_elem = random.randint(1, self._q - 1)
+                c_1 = self.g_power(random_elem) % self._q
+                gcd_ = self.extended_eucledian(random_elem, self._q)[1]
+            c_2 = (digest + self._signing_key * c_1) * gcd_ % self._q
             if c_1 != 0 and c_2 != 0:
                 break
         return str(c_1), str(c_2)
 
+    def start_nonce_pool(self, depth=64, rate=None):
+        """
+        Start precomputing signing nonces for the current key in the background.
+
+        Parameters
+        ----------
+        depth : int
+            maximal number of precomputed nonces
+        rate : float or None
+            maximal number of nonces computed per second, None for no limit
+
+        Returns
+        -------
+        NoncePool
+            the pool, its stats() show hits, misses and fill level
+        """
+        self.stop_nonce_pool()
+        self.nonce_pool = NoncePool(self._p, self._q, self._g, depth, rate, self.window)
+        return self.nonce_pool
+
+    def stop_nonce_pool(self):
+        """
+        Stop the nonce pool, sign() computes nonces inline again.
+        """
+        if self.nonce_pool is not None:
+            self.nonce_pool.stop()
+            self.nonce_pool = None
+
     # Step 3: Verify the signature to find out whether it is valid or not.
 
     def verify(self, message, encoded_tuple):
@@ -206,8 +627,8 @@ class DSA:
 
         Parameters
         ----------
-        message : str
-            string
+        message : str, bytes, os.PathLike, file object or iterable
+            message, see message_digest
         encoded_tuple : tuple
             tuple(string)
 
@@ -217,18 +638,97 @@ class DSA:
             'Signature is valid.' -- if signature is valid
             'Invalid signature!' -- when an invalid signature is encountered
         """
-        c_1, c_2 = encoded_tuple
-        gcd_ = self.extended_eucledian(int(c_2), self._q)[1]
-        t_1 = (int("0x" + SHA256.new(message.encode('ascii')).hexdigest(), 0)) * gcd_ % self._q
-        t_2 = (gcd_ * int(c_1)) % self._q
+        return self.verify_digest(self.message_digest(message), encoded_tuple)
 
-        valid1 = self.exp_square(self._g, t_1, self._p)
-        valid2 = self.exp_square(self.verification_key, t_2, self._p)
-        valid = ((valid1 * valid2) % self._p) % self._q
-        if valid == int(c_1):
+    def verify_digest(self, digest, encoded_tuple):
+        """
+        Verify the signature of an already computed message digest.
+
+        Parameters
+        ----------
+        digest : int or bytes
+            SHA-256 digest of the message
+        encoded_tuple : tuple
+            tuple(string)
+
+        Returns
+        -------
+        string
+            'Signature is valid.' -- if signature is valid
+            'Invalid signature!' -- when an invalid signature is encountered
+        """
+        if not isinstance(digest, int):
+            digest = int.from_bytes(digest, 'big')
+        if self._verify_digest(digest, encoded_tuple, self.verification_key):
             return 'Signature is valid.'
         return 'Invalid signature!'
 
+    def _verify_digest(self, digest, encoded_tuple, verification_key, key_table=None):
+        """
+        Check signature of the digest, optionally with a fixed-base table
+        for the public key.
+
+        Returns
+        -------
+        bool
+            True if signature is valid
+        """
+        c_1, c_2 = int(encoded_tuple[0]), int(encoded_tuple[1])
+        if not (0 < c_1 < self._q and 0 < c_2 < self._q):
+            return False
+        gcd_ = self.extended_eucledian(c_2, self._q)[1]
+        t_1 = digest * gcd_ % self._q
+        t_2 = (gcd_ * c_1) % self._q
+
+        valid1 = self.g_power(t_1)
+        if key_table is None:
+            valid2 = pow(verification_key, t_2, self._p)
+        else:
+            valid2 = key_table.pow(t_2)
+        valid = ((valid1 * valid2) % self._p) % self._q
+        return valid == c_1
+
+    def verify_batch(self, items, workers=1, table_threshold=4):
+        """
+        Verify many signatures over the domain of this instance.
+
+        The table for g is shared by the whole batch, and every public key
+        with at least table_threshold signatures in the batch gets its own
+        fixed-base table, so g^t1 * y^t2 needs no squarings at all.
+
+        Parameters
+        ----------
+        items : iterable
+            (message, signature, public key) tuples
+        workers : int or None
+            number of worker processes for batches of at least
+            parallel_threshold items, None for os.cpu_count()
+        table_threshold : int
+            minimal number of signatures per public key to build its table
+
+        Returns
+        -------
+        list
+            bool for every item, True if its signature is valid
+        """
+        items = list(items)
+        workers = workers or os.cpu_count()
+        if workers > 1 and len(items) >= self.parallel_threshold:
+            size = -(-len(items) // workers)
+            with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(self._p, self._q, self._g, self.window)) as executor:
+                chunks = executor.map(_verify_chunk,
+                                      [items[i : i + size] for i in range(0, len(items), size)],
+                                      [table_threshold] * workers)
+                return [valid for chunk in chunks for valid in chunk]
+
+        counts = Counter(int(key) for _, _, key in items)
+        tables = {key: FixedBaseTable(key, self._p, self._q.bit_length(), self.window)
+                  for key, count in counts.items() if count >= table_threshold}
+        return [self._verify_digest(self.message_digest(message), signature, int(key),
+                                    tables.get(int(key)))
+                for message, signature, key in items]
+
 # dsa = DSA()
 # message = "Wow, hello world!"
 # dsa.generate_keys()
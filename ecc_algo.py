@@ -1,16 +1,64 @@
 """ECC in class"""
 
+import hashlib
+import mmap
+import os
+from collections import OrderedDict
+from threading import Lock
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 from cryptography.hazmat.primitives import padding, hmac, hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
 from cryptography.hazmat.primitives.hashes import SHA256
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.keywrap import aes_key_unwrap, aes_key_wrap
+
+TAG_SIZE = 32  # HMAC-SHA256
+NONCE_SIZE = 12  # AEAD nonce, random for every message
+AEAD_TAG_SIZE = 16
+# encryption schemes: AES-CBC + HMAC-SHA256 or single-pass AEAD
+AEAD_MODES = {"aes-gcm": AESGCM, "chacha20-poly1305": ChaCha20Poly1305}
+MODES = ("cbc-hmac",) + tuple(AEAD_MODES)
+
+
+def read_chunks(source, chunk_size: int, use_mmap: bool = False):
+    """yields chunks of bytes, bytes-like object, path or binary file object,
+    holding at most one chunk in memory; with use_mmap paths are mapped
+    (mapped pages are page cache and show up in RSS, but are reclaimable)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with memoryview(source) as view:
+            for start in range(0, len(view), chunk_size):
+                yield view[start : start + chunk_size]
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            if not use_mmap:
+                yield from read_chunks(file, chunk_size)
+                return
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    for start in range(0, len(view), chunk_size):
+                        with view[start : start + chunk_size] as chunk:
+                            yield chunk
+        return
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
 
 class ECC:
     """class that represents an Elliptic Curve Cryptography
     using Integrated Encryption Scheme"""
 
+    chunk_size = 1 << 20  # bytes processed at once by the streaming methods
+    use_mmap = False  # map input files instead of reading them
+
     def __init__(self, user1:'User', user2:'User', curve=ec.SECP521R1()) -> None:
         self.curve = curve
         self._iv = b"random_ivrandom_"  # generate a valid 16-byte IV
@@ -47,6 +95,17 @@ class ECC:
         )
         return kdf.derive(shared_key)
 
+    def generate_wrap_key(self, shared_key: bytes) -> bytes:
+        """creates key wrapping the data keys of multi-recipient messages"""
+        kdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"key wrapping",
+            backend=default_backend()
+        )
+        return kdf.derive(shared_key)
+
     def aes_enc(self, message: str, key:str) -> str:
         """encrypts given message"""
         # transform message
@@ -60,10 +119,10 @@ class ECC:
         encryptor = cipher.encryptor()
         return encryptor.update(padded_data) + encryptor.finalize()
 
-    def aes_dec(self, c_message: str) -> str:
-        """decrypts message"""
+    def aes_dec(self, c_message: str, key: str = None) -> str:
+        """decrypts message, with the last derived encryption key by default"""
         cipher = Cipher(
-            algorithms.AES(self._kenc), modes.CBC(self._iv), backend=default_backend()
+            algorithms.AES(key or self._kenc), modes.CBC(self._iv), backend=default_backend()
         )
         decryptor = cipher.decryptor()
         decrypted_data = decryptor.update(c_message) + decryptor.finalize()
@@ -77,6 +136,164 @@ class ECC:
         hmac_alg.update(c_message)
         return hmac_alg.finalize()
 
+    @staticmethod
+    def aead_enc(message: bytes, key: bytes, mode: str = "aes-gcm",
+                 associated_data: bytes = None) -> bytes:
+        """encrypts and authenticates message in one pass,
+        returns nonce + ciphertext + tag"""
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + AEAD_MODES[mode](key).encrypt(nonce, message, associated_data)
+
+    @staticmethod
+    def aead_dec(c_message: bytes, key: bytes, mode: str = "aes-gcm",
+                 associated_data: bytes = None) -> bytes:
+        """verifies and decrypts output of aead_enc, raises InvalidTag on forgery"""
+        nonce, c_message = c_message[:NONCE_SIZE], c_message[NONCE_SIZE:]
+        return AEAD_MODES[mode](key).decrypt(nonce, c_message, associated_data)
+
+    def encrypt_stream(self, source, sink, key: bytes, k_mac: bytes) -> bytes:
+        """encrypts source chunk by chunk into sink (object with write()),
+        output is the same as aes_enc followed by generate_tag,
+        memory stays bounded by chunk_size; returns the tag"""
+        padder = padding.PKCS7(128).padder()
+        encryptor = Cipher(
+            algorithms.AES(key), modes.CBC(self._iv), backend=default_backend()
+        ).encryptor()
+        hmac_alg = hmac.HMAC(k_mac, SHA256(), backend=default_backend())
+        for chunk in read_chunks(source, self.chunk_size, self.use_mmap):
+            c_chunk = encryptor.update(padder.update(chunk))
+            hmac_alg.update(c_chunk)
+            sink.write(c_chunk)
+        c_chunk = encryptor.update(padder.finalize()) + encryptor.finalize()
+        hmac_alg.update(c_chunk)
+        sink.write(c_chunk)
+        tag = hmac_alg.finalize()
+        sink.write(tag)
+        return tag
+
+    def decrypt_stream(self, source, sink, key: bytes, k_mac: bytes) -> None:
+        """decrypts output of encrypt_stream into sink chunk by chunk,
+        the tag is verified while streaming and checked at the end:
+        on InvalidSignature everything written to sink must be discarded"""
+        unpadder = padding.PKCS7(128).unpadder()
+        decryptor = Cipher(
+            algorithms.AES(key), modes.CBC(self._iv), backend=default_backend()
+        ).decryptor()
+        hmac_alg = hmac.HMAC(k_mac, SHA256(), backend=default_backend())
+        tail = b""  # the last TAG_SIZE bytes seen, they may be the tag
+        for chunk in read_chunks(source, self.chunk_size, self.use_mmap):
+            data = tail + bytes(chunk)
+            body, tail = data[:-TAG_SIZE], data[-TAG_SIZE:]
+            hmac_alg.update(body)
+            sink.write(unpadder.update(decryptor.update(body)))
+        if len(tail) < TAG_SIZE:
+            raise ValueError("ciphertext is too short")
+        hmac_alg.verify(tail)
+        sink.write(unpadder.update(decryptor.finalize()) + unpadder.finalize())
+
+class ECCSession:
+    """ECIES session of one user caching (k_enc, k_mac) per peer,
+    so repeated messages to the same peer skip ECDH and both HKDFs;
+    mode is one of MODES, the AEAD modes use k_enc only"""
+
+    def __init__(self, user: 'User', capacity: int = 256, mode: str = "cbc-hmac") -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.mode = mode
+        self.user = user
+        self.capacity = capacity
+        self.ecc = ECC(user, user)
+        self._keys = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(public: "ec.EllipticCurvePublicKey") -> bytes:
+        """short digest identifying a public key"""
+        point = public.public_bytes(Encoding.X962, PublicFormat.CompressedPoint)
+        return hashlib.sha256(point).digest()[:16]
+
+    def _derived(self, public: "ec.EllipticCurvePublicKey") -> tuple:
+        """(k_enc, k_mac, k_wrap) shared with the owner of the public key"""
+        fingerprint = self.fingerprint(public)
+        with self._lock:
+            keys = self._keys.get(fingerprint)
+            if keys is not None:
+                self.hits += 1
+                self._keys.move_to_end(fingerprint)
+                return keys
+            self.misses += 1
+
+        shared = self.user._private.exchange(ec.ECDH(), public)
+        keys = (self.ecc.generate_enc_key(shared), self.ecc.generate_mac_key(shared),
+                self.ecc.generate_wrap_key(shared))
+        with self._lock:
+            self._keys[fingerprint] = keys
+            if len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+        return keys
+
+    def keys(self, public: "ec.EllipticCurvePublicKey") -> tuple:
+        """(k_enc, k_mac) shared with the owner of the public key"""
+        return self._derived(public)[:2]
+
+    def invalidate(self, public: "ec.EllipticCurvePublicKey" = None) -> None:
+        """forgets keys of one peer, or of all peers if no key is given"""
+        with self._lock:
+            if public is None:
+                self._keys.clear()
+            else:
+                self._keys.pop(self.fingerprint(public), None)
+
+    def encrypt(self, message: bytes, public: "ec.EllipticCurvePublicKey") -> tuple:
+        """encrypts message for the peer, returns (ciphertext, tag);
+        in the AEAD modes the ciphertext starts with the nonce"""
+        k_enc, k_mac = self.keys(public)
+        if self.mode in AEAD_MODES:
+            sealed = self.ecc.aead_enc(message, k_enc, self.mode)
+            return sealed[:-AEAD_TAG_SIZE], sealed[-AEAD_TAG_SIZE:]
+        c_message = self.ecc.aes_enc(message, k_enc)
+        return c_message, self.ecc.generate_tag(c_message, k_mac)
+
+    def decrypt(self, c_message: bytes, tag: bytes, public: "ec.EllipticCurvePublicKey") -> bytes:
+        """verifies tag and decrypts message from the peer"""
+        k_enc, k_mac = self.keys(public)
+        if self.mode in AEAD_MODES:
+            return self.ecc.aead_dec(c_message + tag, k_enc, self.mode)
+        hmac_alg = hmac.HMAC(k_mac, SHA256(), backend=default_backend())
+        hmac_alg.update(c_message)
+        hmac_alg.verify(tag)
+        return self.ecc.aes_dec(c_message, k_enc)
+
+    def encrypt_envelope(self, message: bytes, publics: list) -> tuple:
+        """encrypts message once for many recipients: the payload is sealed
+        with AES-GCM under a random data key, and only that key is wrapped
+        (RFC 3394) for every recipient with the cached wrapping key;
+        returns (payload, {recipient fingerprint: wrapped data key})"""
+        data_key = AESGCM.generate_key(bit_length=256)
+        payload = self.ecc.aead_enc(message, data_key, "aes-gcm")
+        wrapped = {self.fingerprint(public): aes_key_wrap(self._derived(public)[2], data_key)
+                   for public in publics}
+        return payload, wrapped
+
+    def decrypt_envelope(self, envelope: tuple, public: "ec.EllipticCurvePublicKey") -> bytes:
+        """decrypts an envelope sent by the owner of the public key"""
+        payload, wrapped = envelope
+        wrapped_key = wrapped.get(self.fingerprint(self.user.public))
+        if wrapped_key is None:
+            raise KeyError("envelope is not addressed to this user")
+        data_key = aes_key_unwrap(self._derived(public)[2], wrapped_key)
+        return self.ecc.aead_dec(payload, data_key, "aes-gcm")
+
+    def stats(self) -> dict:
+        """cache counters"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._keys), "capacity": self.capacity}
+
 class User:
     """represents an user"""
     def __init__(self, name:str, curve=ec.SECP256R1()) -> None:
@@ -93,58 +310,59 @@ class User:
         """creates public key according to private one"""
         return self._private.public_key()
 
-# EXAMPLE
-with open('file10.txt', 'rb') as data:
-    data = data.read()
+if __name__ == "__main__":
+    # EXAMPLE
+    with open('file10.txt', 'rb') as data:
+        data = data.read()
 
-MESSAGE =  data #b""
+    MESSAGE =  data #b""
 
-# setting users
-Alice = User("Alice")
-Bob = User("Bob")
+    # setting users
+    Alice = User("Alice")
+    Bob = User("Bob")
 
-# an class instance
-ecc_algo = ECC(Alice, Bob)
+    # an class instance
+    ecc_algo = ECC(Alice, Bob)
 
-# PART 1
+    # PART 1
 
-# shared secret for alice
-secret_a = ecc_algo.generate_shared(Alice)
+    # shared secret for alice
+    secret_a = ecc_algo.generate_shared(Alice)
 
-# creating k_enc1 and k_mac1
-k_enc1 = ecc_algo.generate_enc_key(secret_a)
-k_mac1 = ecc_algo.generate_mac_key(secret_a)
+    # creating k_enc1 and k_mac1
+    k_enc1 = ecc_algo.generate_enc_key(secret_a)
+    k_mac1 = ecc_algo.generate_mac_key(secret_a)
 
-# encrypting message
-a_encrypted = ecc_algo.aes_enc(MESSAGE, k_enc1)
+    # encrypting message
+    a_encrypted = ecc_algo.aes_enc(MESSAGE, k_enc1)
 
-# create a_tag
-a_tag = ecc_algo.generate_tag(a_encrypted, k_mac1)
+    # create a_tag
+    a_tag = ecc_algo.generate_tag(a_encrypted, k_mac1)
 
-# PART 2
+    # PART 2
 
-# shared secret for bob
-secret_b = ecc_algo.generate_shared(Bob)
+    # shared secret for bob
+    secret_b = ecc_algo.generate_shared(Bob)
 
-# creating k_enc2 and k_mac2
-k_enc2 = ecc_algo.generate_enc_key(secret_b)
-k_mac2 = ecc_algo.generate_mac_key(secret_b)
+    # creating k_enc2 and k_mac2
+    k_enc2 = ecc_algo.generate_enc_key(secret_b)
+    k_mac2 = ecc_algo.generate_mac_key(secret_b)
 
-# encrypting message
-b_encrypted = ecc_algo.aes_enc(MESSAGE, k_enc2)
+    # encrypting message
+    b_encrypted = ecc_algo.aes_enc(MESSAGE, k_enc2)
 
-# create b_tag
-b_tag = ecc_algo.generate_tag(b_encrypted, k_mac2)
+    # create b_tag
+    b_tag = ecc_algo.generate_tag(b_encrypted, k_mac2)
 
-# vefiry tags
-if a_tag == b_tag:
-    decrypted = ecc_algo.aes_dec(b_encrypted)
-else:
-    print("MAC verification failed. Message declined.")
+    # vefiry tags
+    if a_tag == b_tag:
+        decrypted = ecc_algo.aes_dec(b_encrypted)
+    else:
+        print("MAC verification failed. Message declined.")
 
-# RESULTS
+    # RESULTS
 
-# print("Message: ", MESSAGE)
-# print("Encrypted: ", b_encrypted)
-# print("Decrypted: ", decrypted)
-# print(MESSAGE==decrypted)
+    # print("Message: ", MESSAGE)
+    # print("Encrypted: ", b_encrypted)
+    # print("Decrypted: ", decrypted)
+    # print(MESSAGE==decrypted)
@@ -0,0 +1,65 @@
+"""
+Fixed-base modular exponentiation with a precomputed table.
+
+When the base and the modulus never change (a group generator), the powers
+base^(d * 2^(w * i)) can be computed once. Every exponentiation then costs
+one multiplication per w-bit digit of the exponent and no squarings.
+"""
+
+
+class FixedBaseTable:
+    """
+    Table of powers of a fixed base for exponents of up to `bits` bits.
+
+    The table holds ceil(bits / window) rows of 2^window - 1 residues,
+    so memory is bounded by the window size.
+    """
+    def __init__(self, base: int, mod: int, bits: int, window: int = 4) -> None:
+        if not isinstance(window, int) or not 1 <= window <= 16:
+            raise ValueError('window must be an int between 1 and 16')
+        self.base = base % mod
+        self.mod = mod
+        self.bits = bits
+        self.window = window
+        self._mask = (1 << window) - 1
+        self._rows = []
+        row_base = self.base
+        for _ in range(-(-bits // window)):
+            row = [row_base]
+            for _ in range(self._mask - 1):
+                row.append(row[-1] * row_base % mod)
+            self._rows.append(row)
+            # base^(2^window) for the next digit
+            row_base = row[-1] * row_base % mod
+
+    def __len__(self):
+        """Number of stored residues."""
+        return len(self._rows) * self._mask
+
+    def pow(self, exp: int):
+        """
+        Compute base^exp mod (mod).
+
+        Parameters
+        ----------
+        exp : int
+            non-negative integer, exponents longer than `bits`
+            fall back to the builtin pow
+
+        Returns
+        -------
+        int
+            base^exp mod (mod)
+        """
+        if exp < 0 or exp.bit_length() > self.bits:
+            return pow(self.base, exp, self.mod)
+        result = 1
+        mod = self.mod
+        for row in self._rows:
+            if not exp:
+                break
+            digit = exp & self._mask
+            if digit:
+                result = result * row[digit - 1] % mod
+            exp >>= self.window
+        return result % mod
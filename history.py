@@ -0,0 +1,183 @@
+"""
+Bounded message history of a chat room.
+
+Every room keeps only its last `capacity` messages in a ring buffer,
+older ones are evicted as new ones arrive. Messages are numbered with a
+per-room sequence number, so clients can page backwards through what is
+still kept. With a message store the ring buffer is only the hot tail of
+the room, evicted messages are read back from the store.
+"""
+import json
+from collections import deque
+from itertools import islice
+
+
+class Message:
+    """
+    Chat message record.
+    """
+    __slots__ = ("seq", "name", "message")
+
+    def __init__(self, seq: int, name: str, message: str) -> None:
+        self.seq = seq
+        self.name = name
+        self.message = message
+
+    def to_dict(self):
+        """
+        Message as sent over the socket.
+        """
+        return {"seq": self.seq, "name": self.name, "message": self.message}
+
+
+class RoomHistory:
+    """
+    Fixed-capacity history of the messages of one room.
+    """
+    def __init__(self, capacity: int = 1000, room: str | None = None, store=None) -> None:
+        if not isinstance(capacity, int):
+            raise TypeError('invalid type, int expected')
+        if capacity < 1:
+            raise ValueError('capacity must be positive')
+        self.capacity = capacity
+        self.room = room
+        self.store = store
+        self.next_seq = 0
+        self._messages = deque(maxlen=capacity)
+
+    @classmethod
+    def load(cls, store, room: str, capacity: int = 1000):
+        """
+        History of a room with the hot tail read back from the store.
+        """
+        history = cls(capacity, room, store)
+        history._messages.extend(store.page(room, limit=capacity))
+        history.next_seq = store.next_seq(room)
+        return history
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def first_seq(self):
+        """
+        Sequence number of the oldest kept message.
+        """
+        return self.next_seq - len(self._messages)
+
+    @property
+    def oldest_seq(self):
+        """
+        Sequence number of the oldest message that can be paged to.
+        """
+        return 0 if self.store is not None else self.first_seq
+
+    def append(self, name: str, message: str):
+        """
+        Add a message, evicting the oldest one when the history is full.
+        """
+        record = Message(self.next_seq, name, message)
+        self._messages.append(record)
+        self.next_seq += 1
+        if self.store is not None:
+            self.store.append(self.room, record)
+        return record
+
+    def since(self, after: int | None, limit: int):
+        """
+        Messages with a sequence number above `after`, at most the newest `limit`.
+        """
+        missed = self.next_seq if after is None else self.next_seq - after - 1
+        return self.page(limit = max(min(missed, limit), 0)) if missed > 0 else []
+
+    def page(self, before: int | None = None, limit: int = 50):
+        """
+        Up to `limit` kept messages with a sequence number below `before`,
+        oldest first. The newest messages are returned if before is None.
+        """
+        size = len(self._messages)
+        end = size if before is None else min(max(before - self.first_seq, 0), size)
+        start = max(end - limit, 0)
+        if end <= size - start:
+            page = list(islice(self._messages, start, end))
+        else:
+            # closer to the newest end: walk the ring from the right
+            page = list(islice(reversed(self._messages), size - end, size - start))
+            page.reverse()
+        if self.store is not None and len(page) < limit and self.first_seq > 0:
+            older = self.store.page(self.room, self.first_seq if before is None
+                                    else min(self.first_seq, before), limit - len(page))
+            page = older + page
+        return page
+
+
+class SharedHistory(RoomHistory):
+    """
+    History of one room kept in a Redis-compatible server, shared by
+    every worker process.
+
+    The hot tail is a sorted set scored by sequence number, so appends
+    from different workers stay ordered; the sequence numbers come from
+    one INCR counter.
+    """
+    def __init__(self, client, key: str, capacity: int = 1000, room: str | None = None,
+                 store=None) -> None:
+        if capacity < 1:
+            raise ValueError('capacity must be positive')
+        self.client = client
+        self.capacity = capacity
+        self.room = room
+        self.store = store
+        self._seq_key = f"{key}:seq"
+        self._messages_key = f"{key}:messages"
+
+    def __len__(self):
+        return self.client.zcard(self._messages_key)
+
+    @property
+    def next_seq(self):
+        return int(self.client.get(self._seq_key) or 0)
+
+    @property
+    def first_seq(self):
+        oldest = self.client.zrange(self._messages_key, 0, 0, withscores=True)
+        return int(oldest[0][1]) if oldest else self.next_seq
+
+    @staticmethod
+    def _record(member):
+        seq, name, message = json.loads(member)
+        return Message(seq, name, message)
+
+    def extend(self, records: list):
+        """
+        Put already numbered messages into the hot tail.
+        """
+        if records:
+            self.client.zadd(self._messages_key, {
+                json.dumps([record.seq, record.name, record.message]): record.seq
+                for record in records
+            })
+
+    def append(self, name: str, message: str):
+        record = Message(self.client.incr(self._seq_key) - 1, name, message)
+        pipe = self.client.pipeline()
+        pipe.zadd(self._messages_key, {json.dumps([record.seq, name, message]): record.seq})
+        pipe.zremrangebyrank(self._messages_key, 0, -self.capacity - 1)
+        pipe.execute()
+        if self.store is not None:
+            self.store.append(self.room, record)
+        return record
+
+    def page(self, before: int | None = None, limit: int = 50):
+        high = "+inf" if before is None else f"({before}"
+        page = [self._record(member) for member in self.client.zrevrangebyscore(
+            self._messages_key, high, "-inf", start=0, num=limit)]
+        page.reverse()
+        if self.store is not None and len(page) < limit:
+            if page:
+                bound = page[0].seq
+            else:
+                bound = self.first_seq if before is None else min(self.first_seq, before)
+            if bound > 0:
+                page = self.store.page(self.room, bound, limit - len(page)) + page
+        return page
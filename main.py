@@ -3,17 +3,88 @@
 Messenger using sockets which are live way of comunicating
 rather than refreshing the page or saving stuff in the data base to
 transmit the messages.
+
+The server runs on the Werkzeug development server by default. Setting the
+ASYNC_MODE environment variable to eventlet or gevent serves every
+connection from a green thread, so one process can hold many idle
+websockets.
 """
+import os
+
+ASYNC_MODES = ("threading", "eventlet", "gevent")
+ASYNC_MODE = os.environ.get("ASYNC_MODE", "threading")
+if ASYNC_MODE not in ASYNC_MODES:
+    raise ValueError(f"ASYNC_MODE must be one of {ASYNC_MODES}")
+# the standard library has to be patched before anything else imports it
+if ASYNC_MODE == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 from secrets import token_urlsafe
 from flask import Flask, render_template, request, session, redirect, url_for
-from flask_socketio import join_room, leave_room, send, SocketIO
+from flask_socketio import emit, join_room, leave_room, send, SocketIO
+from message_store import MessageStore
+from room_state import MemoryRooms, SharedRooms
 # from ElGamal import ELGamal
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "ZVNWwozcg34rxEpDgPGg1IXf8mPxiUkKo9q6osBywXIEKTU1l7MuRSSzF72IgUmDXckeds"
-socketio = SocketIO(app)
+# messages kept per room and messages sent in one page
+app.config["HISTORY_SIZE"] = 1000
+app.config["HISTORY_PAGE"] = 50
+# most messages a reconnecting client is sent, it starts over when it missed more
+app.config["RESYNC_LIMIT"] = 1000
+# SQLite file the messages are kept in, an empty value keeps them in memory only
+app.config["MESSAGE_STORE"] = os.environ.get("MESSAGE_STORE", "messages.db")
+# redis:// URL shared by all worker processes, None runs a single process
+app.config["MESSAGE_QUEUE"] = os.environ.get("MESSAGE_QUEUE")
+app.config["ASYNC_MODE"] = ASYNC_MODE
+app.config["HOST"] = os.environ.get("HOST", "127.0.0.1")
+app.config["PORT"] = int(os.environ.get("PORT", 5000))
+# connections one eventlet process accepts at once
+app.config["MAX_CONNECTIONS"] = int(os.environ.get("MAX_CONNECTIONS", 65536))
+socketio = SocketIO(
+    app, async_mode = ASYNC_MODE, message_queue = app.config["MESSAGE_QUEUE"]
+)
+
+# handlers only put records on a queue, a listener thread writes them out
+log = logging.getLogger("messenger")
+log.setLevel(logging.INFO)
+log.propagate = False
+log_queue = SimpleQueue()
+log.addHandler(QueueHandler(log_queue))
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+log_listener = QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+store = None
+if app.config["MESSAGE_STORE"]:
+    store = MessageStore(app.config["MESSAGE_STORE"])
+    atexit.register(store.close)
+
+if app.config["MESSAGE_QUEUE"]:
+    rooms = SharedRooms.from_url(
+        app.config["MESSAGE_QUEUE"], capacity = app.config["HISTORY_SIZE"], store = store
+    )
+else:
+    rooms = MemoryRooms(app.config["HISTORY_SIZE"], store)
+
+
+def sequence_number(value):
+    """
+    Sequence number sent by a client, None unless it is an int.
+    """
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
 
-rooms = {}
 
 def generate_unique_code(length: int):
     """
@@ -57,8 +128,8 @@ def home():
         room = code
         if create is not False:
             room = generate_unique_code(10)
-            rooms[room] = {"members": 0, "messages": [], "users": {}}
-        elif code not in rooms:
+            rooms.create(room)
+        elif rooms.history(code) is None:
             return render_template(
                 "home.html", error = "Room does not exist.", code = code, name = name
             )
@@ -76,10 +147,10 @@ def room():
     Chat room page.
     """
     room = session.get("room")
-    if room is None or session.get("name") is None or room not in rooms:
+    if room is None or session.get("name") is None or rooms.history(room) is None:
         return redirect(url_for("home"))
 
-    return render_template("room.html", code = room, messages = rooms[room]["messages"])
+    return render_template("room.html", code = room)
 
 
 @socketio.on("message")
@@ -87,33 +158,69 @@ def message(data):
     """
     Message.
     """
-    room = session.get("room")
-    if room not in rooms:
+    if not isinstance(data, dict) or not isinstance(data.get("data"), str):
+        return
+    history = rooms.history(session.get("room"))
+    if history is None:
+        return
+
+    record = history.append(session.get("name"), data["data"])
+    send(record.to_dict(), to = history.room)
+    log.info("%s said: %s", session.get("name"), data["data"])
+
+
+@socketio.on("history")
+def history(data):
+    """
+    Page of older messages.
+    """
+    history = rooms.history(session.get("room"))
+    if history is None:
         return
 
-    content = {"name": session.get("name"), "message": data["data"]}
-    send(content, to = room)
-    rooms[room]["messages"].append(content)
-    print(f"{session.get('name')} said: {data['data']}")
+    before = sequence_number(data.get("before")) if isinstance(data, dict) else None
+    page = history.page(before, app.config["HISTORY_PAGE"])
+    emit("history", {
+        "messages": [record.to_dict() for record in page],
+        "more": bool(page) and page[0].seq > history.oldest_seq,
+    })
 
 
 @socketio.on("connect")
-def connect():
+def connect(auth = None):
     """
     Initializing the socket.
+
+    The client sends the last sequence number it has seen and gets the
+    messages it missed in one frame, or the last page when it has none.
     """
     room = session.get("room")
     name = session.get("name")
     if not room or not name:
         return
-    if room not in rooms:
+    # counted in first, so the room cannot be dropped while it is resynced
+    if not rooms.join(room):
         leave_room(room)
         return
 
+    history = rooms.history(room)
     join_room(room)
+    last_seq = sequence_number(auth.get("last_seq")) if isinstance(auth, dict) else None
+    next_seq = history.next_seq
+    # the room was recreated or lost messages, or the client missed more than
+    # a resync may carry: it starts over from the newest page
+    if last_seq is not None and not 0 <= next_seq - last_seq - 1 <= app.config["RESYNC_LIMIT"]:
+        last_seq = None
+    limit = app.config["HISTORY_PAGE"] if last_seq is None else app.config["RESYNC_LIMIT"]
+    missed = history.since(last_seq, limit)
+    emit("resync", {
+        "messages": [record.to_dict() for record in missed],
+        # the client drops what it has when the missed messages do not follow it
+        "reset": last_seq is None or (bool(missed) and missed[0].seq != last_seq + 1),
+        "more": bool(missed) and missed[0].seq > history.oldest_seq,
+    })
     send({"name": name, "message": "has entered the room"}, to = room)
-    rooms[room]["members"] += 1
-    print(f"{name} joined room {room}")
+    log.info("%s joined room %s", name, room)
 
 
 @socketio.on("disconnect")
@@ -125,14 +232,19 @@ def disconnect():
     name = session.get("name")
     leave_room(room)
 
-    if room in rooms:
-        rooms[room]["members"] -= 1
-        if rooms[room]["members"] <= 0:
-            del rooms[room]
+    rooms.leave(room)
 
     send({"name": name, "message": "has left the room"}, to = room)
-    print(f"{name} has left the room {room}")
+    log.info("%s has left the room %s", name, room)
 
 
 if __name__ == "__main__":
-    socketio.run(app, debug = True)
+    if ASYNC_MODE == "threading":
+        socketio.run(app, app.config["HOST"], app.config["PORT"], debug = True)
+    elif ASYNC_MODE == "eventlet":
+        socketio.run(
+            app, app.config["HOST"], app.config["PORT"], log_output = False,
+            max_size = app.config["MAX_CONNECTIONS"]
+        )
+    else:
+        socketio.run(app, app.config["HOST"], app.config["PORT"], log_output = False)
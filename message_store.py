@@ -0,0 +1,202 @@
+"""
+Persistent message store of the messenger.
+
+Messages are appended to an SQLite table keyed by (room, seq), so a range
+of the history of a room is one index lookup. Appends are only queued by
+the caller; a background thread writes them in batches, one transaction
+per batch, so socket handlers never wait on the disk. Reads merge the
+queued rows with the table instead of waiting for the writer.
+
+Under eventlet or gevent the writer is a green thread, so the SQLite calls
+themselves are run on a native thread pool and do not stall the event loop.
+"""
+import logging
+import sqlite3
+import sys
+from queue import Queue, Empty
+from threading import Event, Lock, Thread
+from history import Message
+
+log = logging.getLogger("messenger")
+
+
+def native_call():
+    """
+    Function f(func, *args) running a blocking call off the event loop when
+    the standard library is monkey-patched, directly otherwise.
+    """
+    if "eventlet" in sys.modules:
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched("thread"):
+            return tpool.execute
+    if "gevent" in sys.modules:
+        from gevent import get_hub, monkey
+        if monkey.is_module_patched("threading"):
+            return lambda func, *args: get_hub().threadpool.apply(func, args)
+    return lambda func, *args: func(*args)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    room TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    name TEXT,
+    message TEXT,
+    PRIMARY KEY (room, seq)
+) WITHOUT ROWID
+"""
+
+
+class MessageStore:
+    """
+    Append-only SQLite message log with a batching writer thread.
+    """
+    def __init__(self, path: str = "messages.db", batch_size: int = 256) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = Queue()
+        # room -> {seq: row} of the queued messages, until they are written
+        self._unwritten = {}
+        self._unwritten_lock = Lock()
+        self._read_lock = Lock()
+        self._native = native_call()
+        self._reader = self._connect()
+        self._reader.execute(_SCHEMA)
+        self._reader.commit()
+        self._writer = Thread(target=self._write_loop, name="message-store", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        # readers do not block the writer and the other way round
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def append(self, room: str, record: Message):
+        """
+        Queue a message for writing.
+        """
+        row = (room, record.seq, record.name, record.message)
+        with self._unwritten_lock:
+            self._unwritten.setdefault(room, {})[record.seq] = row
+        self._queue.put(row)
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except Empty:
+                    break
+            try:
+                if batch:
+                    self._native(self._write, connection, batch)
+            finally:
+                # a failed write must not leave flush() waiting forever
+                self._forget(batch)
+                for waiter in waiters:
+                    waiter.set()
+            if stop:
+                connection.close()
+                return
+
+    def _forget(self, batch: list):
+        """
+        Drop written (or failed) rows from the unwritten ones.
+        """
+        with self._unwritten_lock:
+            for room, seq, _, _ in batch:
+                rows = self._unwritten.get(room)
+                if rows is not None and seq in rows:
+                    del rows[seq]
+                    if not rows:
+                        del self._unwritten[room]
+
+    @staticmethod
+    def _write(connection, batch: list):
+        """
+        Write a batch in one transaction; if it fails, write the rows one
+        by one so a single bad row only loses itself. The log is append-only,
+        a reused (room, seq) is rejected and logged.
+        """
+        query = "INSERT INTO messages VALUES (?, ?, ?, ?)"
+        try:
+            with connection:
+                connection.executemany(query, batch)
+            return
+        except Exception:
+            log.exception("writing a batch of %d messages failed", len(batch))
+        for row in batch:
+            try:
+                with connection:
+                    connection.execute(query, row)
+            except Exception:
+                log.exception("dropped message %d of room %s", row[1], row[0])
+
+    def flush(self):
+        """
+        Wait until every queued message is written.
+        """
+        with self._unwritten_lock:
+            if not self._unwritten:
+                return
+        done = Event()
+        self._queue.put(done)
+        done.wait()
+
+    def page(self, room: str, before: int | None = None, limit: int = 50):
+        """
+        Up to `limit` messages of the room with a sequence number below
+        `before`, oldest first.
+        """
+        if before is None:
+            before = 1 << 62
+        # taken before the query, rows written meanwhile are then found twice at worst
+        with self._unwritten_lock:
+            unwritten = [row[1:] for row in self._unwritten.get(room, {}).values()
+                         if row[1] < before]
+        with self._read_lock:
+            rows = self._native(self._query, (
+                "SELECT seq, name, message FROM messages WHERE room = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?"), (room, before, limit))
+        if unwritten:
+            rows = sorted(dict((row[0], row) for row in rows + unwritten).values(),
+                          reverse=True)[:limit]
+        rows.reverse()
+        return [Message(*row) for row in rows]
+
+    def _query(self, query: str, params: tuple):
+        return self._reader.execute(query, params).fetchall()
+
+    def next_seq(self, room: str):
+        """
+        Sequence number of the next message of the room, counting the
+        messages queued in this process.
+        """
+        with self._unwritten_lock:
+            unwritten = max(self._unwritten.get(room, {}), default=-1)
+        with self._read_lock:
+            ((last,),) = self._native(
+                self._query, "SELECT MAX(seq) FROM messages WHERE room = ?", (room,))
+        return max(-1 if last is None else last, unwritten) + 1
+
+    def close(self):
+        """
+        Write the queued messages and stop the writer thread.
+        """
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._read_lock:
+            self._reader.close()
@@ -0,0 +1,179 @@
+"""
+Pool of pre-generated primes shared by RSA, DSA and Rabin key generation.
+
+Primes are searched for in background worker processes, so key generation
+only has to take a ready prime from the queue of its class.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import RLock
+from prime_search import find_prime
+
+KINDS = ('plain', 'blum')
+
+
+def generate_prime(bits: int, kind: str = 'plain'):
+    """
+    Generate a random prime of the given class.
+
+    Parameters
+    ----------
+    bits : int
+        bit length of the prime
+    kind : str
+        'plain' for any prime, 'blum' for a prime p = 3 mod 4
+
+    Returns
+    -------
+    int
+        prime
+    """
+    return find_prime(bits, kind)
+
+
+class PrimePool:
+    """
+    Background pool of primes grouped by (bits, kind) class.
+
+    A class is refilled up to its high-water mark as soon as it drops below
+    its low-water mark. Taking a prime from a non-empty class is a hit,
+    otherwise the prime is generated in the calling process and counted as a miss.
+    """
+    def __init__(self, workers: int | None = None) -> None:
+        self._executor = ProcessPoolExecutor(workers)
+        self._lock = RLock()
+        self._queues = {}
+        self._marks = {}
+        self._pending = {}
+        self._hits = {}
+        self._misses = {}
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _valid_class(bits: int, kind: str):
+        """
+        Validate prime class.
+
+        Returns
+        -------
+        tuple
+            (bits, kind)
+        """
+        if not isinstance(bits, int):
+            raise TypeError('invalid type, int expected')
+        if bits < 2:
+            raise ValueError('bit length must be at least 2')
+        if kind not in KINDS:
+            raise ValueError(f'kind must be one of {KINDS}')
+        return bits, kind
+
+    def reserve(self, bits: int, kind: str = 'plain', low_water: int = 4,
+                high_water: int | None = None):
+        """
+        Register a prime class and start filling it.
+
+        Parameters
+        ----------
+        bits : int
+            bit length of the primes
+        kind : str
+            'plain' or 'blum'
+        low_water : int
+            refill is started when fewer primes are available
+        high_water : int or None
+            number of primes the class is refilled to, 2 * low_water by default
+        """
+        key = self._valid_class(bits, kind)
+        high_water = 2 * low_water if high_water is None else high_water
+        if not 0 <= low_water <= high_water:
+            raise ValueError('0 <= low_water <= high_water expected')
+        with self._lock:
+            self._marks[key] = (low_water, high_water)
+            self._queues.setdefault(key, deque())
+            self._pending.setdefault(key, 0)
+            self._hits.setdefault(key, 0)
+            self._misses.setdefault(key, 0)
+            self._refill(key)
+
+    def _refill(self, key: tuple):
+        """
+        Submit enough jobs to bring the class to its high-water mark.
+        Must be called with the lock held.
+        """
+        low_water, high_water = self._marks[key]
+        available = len(self._queues[key]) + self._pending[key]
+        if self._closed or available >= low_water:
+            return
+        for _ in range(high_water - available):
+            self._pending[key] += 1
+            future = self._executor.submit(generate_prime, *key)
+            future.add_done_callback(lambda fut, key=key: self._store(key, fut))
+
+    def _store(self, key: tuple, future):
+        """
+        Put a prime generated in the background into its queue.
+        """
+        with self._lock:
+            self._pending[key] -= 1
+            if not future.cancelled() and future.exception() is None:
+                self._queues[key].append(future.result())
+
+    def get(self, bits: int, kind: str = 'plain'):
+        """
+        Take a prime of the given class.
+
+        Unregistered classes are registered with the default marks.
+
+        Parameters
+        ----------
+        bits : int
+            bit length of the prime
+        kind : str
+            'plain' or 'blum'
+
+        Returns
+        -------
+        int
+            prime
+        """
+        key = self._valid_class(bits, kind)
+        if key not in self._marks:
+            self.reserve(bits, kind)
+        with self._lock:
+            queue = self._queues[key]
+            prime = queue.popleft() if queue else None
+            if prime is None:
+                self._misses[key] += 1
+            else:
+                self._hits[key] += 1
+            self._refill(key)
+        return generate_prime(bits, kind) if prime is None else prime
+
+    def stats(self):
+        """
+        Usage counters per prime class.
+
+        Returns
+        -------
+        dict
+            (bits, kind) -> dict with hits, misses, available and pending
+        """
+        with self._lock:
+            return {key: {'hits': self._hits[key], 'misses': self._misses[key],
+                          'available': len(self._queues[key]),
+                          'pending': self._pending[key]}
+                    for key in self._marks}
+
+    def close(self):
+        """
+        Stop the background workers.
+        """
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
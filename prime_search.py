@@ -0,0 +1,216 @@
+"""
+Incremental sieve-based prime search shared by the key generation code.
+
+A single random start point is chosen and a whole window of candidates
+is sieved against the small primes at once. Only the survivors are
+passed to the Miller-Rabin test.
+"""
+import random
+
+_random = random.SystemRandom()
+
+
+def small_primes(limit: int):
+    """
+    Sieve of Eratosthenes.
+
+    Parameters
+    ----------
+    limit : int
+        upper bound (exclusive)
+
+    Returns
+    -------
+    list
+        odd primes below limit
+    """
+    sieve = bytearray([1]) * limit
+    sieve[:2] = b'\x00\x00'
+    for num in range(2, int(limit ** 0.5) + 1):
+        if sieve[num]:
+            sieve[num * num :: num] = bytes(len(range(num * num, limit, num)))
+    return [num for num in range(3, limit, 2) if sieve[num]]
+
+
+SMALL_PRIMES = small_primes(1 << 15)
+_SMALL_PRIMES_SET = frozenset(SMALL_PRIMES)
+# inverses of the candidate step modulo every small prime
+_STEP_INVERSES = {step: [pow(step, -1, prime) for prime in SMALL_PRIMES] for step in (2, 4)}
+
+
+def miller_rabin(num: int, rounds: int = 20):
+    """
+    Miller-Rabin probabilistic primality test.
+
+    Parameters
+    ----------
+    num : int
+        odd integer greater than 3
+    rounds : int
+        number of random bases
+
+    Returns
+    -------
+    bool
+        False if num is composite, True if it is probably prime
+    """
+    odd = num - 1
+    divisions = 0
+    while odd % 2 == 0:
+        odd //= 2
+        divisions += 1
+
+    for _ in range(rounds):
+        witness = pow(_random.randrange(2, num - 1), odd, num)
+        if witness in (1, num - 1):
+            continue
+        for _ in range(divisions - 1):
+            witness = witness * witness % num
+            if witness == num - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def search_rounds(bits: int):
+    """
+    Miller-Rabin rounds for a random candidate of the given size.
+
+    Random candidates need far fewer rounds than adversarial input
+    for an error probability below 2^-100 (FIPS 186-4, table C.2).
+    """
+    if bits >= 1536:
+        return 4
+    if bits >= 1024:
+        return 5
+    if bits >= 512:
+        return 8
+    return 20
+
+
+def is_prime(num: int, rounds: int = 20):
+    """
+    Check if the given number is prime, using trial division first.
+    """
+    if num < 2:
+        return False
+    if num % 2 == 0:
+        return num == 2
+    for prime in SMALL_PRIMES:
+        if num % prime == 0:
+            return num == prime
+        if prime * prime > num:
+            return True
+    return miller_rabin(num, rounds)
+
+
+def sieve_window(start: int, step: int, window: int):
+    """
+    Mark candidates start + step * i, 0 <= i < window, with no small factor.
+
+    Parameters
+    ----------
+    start : int
+        first candidate, odd
+    step : int
+        distance between candidates, 2 or 4
+    window : int
+        number of candidates
+
+    Returns
+    -------
+    bytearray
+        1 for every candidate that survived the sieve
+    """
+    sieve = bytearray([1]) * window
+    for prime, inverse in zip(SMALL_PRIMES, _STEP_INVERSES[step]):
+        if prime >= start:
+            break
+        # first i with start + step * i = 0 (mod prime)
+        first = -(start % prime) * inverse % prime
+        sieve[first::prime] = bytes(len(range(first, window, prime)))
+    return sieve
+
+
+def find_prime(bits: int, kind: str = 'plain', window: int = 4096):
+    """
+    Return a random prime with exactly the given number of bits.
+
+    Parameters
+    ----------
+    bits : int
+        bit length of the prime
+    kind : str
+        'plain' for any prime, 'blum' for a prime p = 3 mod 4
+    window : int
+        number of candidates sieved in one pass
+
+    Returns
+    -------
+    int
+        prime
+    """
+    if kind not in ('plain', 'blum'):
+        raise ValueError("kind must be 'plain' or 'blum'")
+    if bits < 3:
+        raise ValueError('bit length must be at least 3')
+    # Blum primes are the candidates 3 (mod 4), plain ones are all odd numbers
+    step, residue = (4, 3) if kind == 'blum' else (2, 1)
+    rounds = search_rounds(bits)
+    while True:
+        start = _random.getrandbits(bits) | (1 << (bits - 1))
+        start += (residue - start) % step
+        while start.bit_length() == bits:
+            sieve = sieve_window(start, step, window)
+            index = sieve.find(1)
+            while index != -1:
+                candidate = start + step * index
+                if candidate.bit_length() != bits:
+                    break
+                if candidate in _SMALL_PRIMES_SET or miller_rabin(candidate, rounds):
+                    return candidate
+                index = sieve.find(1, index + 1)
+            start += step * window
+
+
+def find_safe_prime(bits: int, window: int = 4096):
+    """
+    Return a random safe prime p = 2q + 1 (q prime) with the given number of bits.
+
+    Candidates q are sieved so that neither q nor 2q + 1 has a small factor.
+
+    Parameters
+    ----------
+    bits : int
+        bit length of p
+    window : int
+        number of candidates sieved in one pass
+
+    Returns
+    -------
+    int
+        safe prime
+    """
+    if bits < 6:
+        raise ValueError('bit length must be at least 6')
+    rounds = search_rounds(bits)
+    while True:
+        start = _random.getrandbits(bits - 1) | (1 << (bits - 2)) | 1
+        while start.bit_length() == bits - 1:
+            sieve = sieve_window(start, 2, window)
+            for prime, inverse in zip(SMALL_PRIMES, _STEP_INVERSES[2]):
+                if prime >= start:
+                    break
+                # first i with 2 * (start + 2 * i) + 1 = 0 (mod prime)
+                first = ((prime - 1) * inverse - start) * inverse % prime
+                sieve[first::prime] = bytes(len(range(first, window, prime)))
+            index = sieve.find(1)
+            while index != -1:
+                candidate = start + 2 * index
+                if candidate.bit_length() != bits - 1:
+                    break
+                if miller_rabin(candidate, rounds) and miller_rabin(2 * candidate + 1, rounds):
+                    return 2 * candidate + 1
+                index = sieve.find(1, index + 1)
+            start += 2 * window
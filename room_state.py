@@ -0,0 +1,188 @@
+"""
+Room state backends of the messenger.
+
+MemoryRooms keeps the rooms in the worker process, which is all a single
+process needs. SharedRooms keeps them in a Redis-compatible server, so
+several workers behind a load balancer (sharing broadcasts through the
+Flask-SocketIO message queue) see the same rooms, members and history.
+"""
+from history import RoomHistory, SharedHistory
+
+
+class MemoryRooms:
+    """
+    Rooms of one worker process.
+    """
+    def __init__(self, capacity: int = 1000, store=None) -> None:
+        self.capacity = capacity
+        self.store = store
+        self._rooms = {}
+
+    def __contains__(self, code: str):
+        return code in self._rooms or \
+            (self.store is not None and self.store.next_seq(code) > 0)
+
+    def create(self, code: str):
+        """
+        Add an empty room.
+        """
+        self._rooms[code] = {
+            "members": 0, "messages": RoomHistory(self.capacity, code, self.store)
+        }
+
+    def _open(self, code: str):
+        """
+        Room state, the history of a stored room is read back from the store.
+        """
+        if code in self._rooms:
+            return self._rooms[code]
+        if self.store is None or not self.store.next_seq(code):
+            return None
+        self._rooms[code] = {
+            "members": 0, "messages": RoomHistory.load(self.store, code, self.capacity)
+        }
+        return self._rooms[code]
+
+    def history(self, code: str):
+        """
+        History of the room, None if there is no such room.
+        """
+        room = self._open(code)
+        return None if room is None else room["messages"]
+
+    def join(self, code: str):
+        """
+        Count a new member of the room, returns the number of members,
+        0 if there is no such room.
+        """
+        room = self._open(code)
+        if room is None:
+            return 0
+        room["members"] += 1
+        return room["members"]
+
+    def leave(self, code: str):
+        """
+        Count a member out, the room is dropped when nobody is left.
+        """
+        room = self._rooms.get(code)
+        if room is None:
+            return 0
+        room["members"] -= 1
+        if room["members"] <= 0:
+            del self._rooms[code]
+        return max(room["members"], 0)
+
+
+class SharedRooms:
+    """
+    Rooms kept in a Redis-compatible server.
+
+    `client` is anything with the redis-py API (a redis.Redis or a
+    fakeredis.FakeRedis in tests).
+    """
+    def __init__(self, client, capacity: int = 1000, store=None,
+                 prefix: str = "messenger:room:") -> None:
+        self.client = client
+        self.capacity = capacity
+        self.store = store
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        """
+        Backend on the server at the given redis:// URL.
+        """
+        try:
+            import redis
+        except ImportError as error:
+            raise ImportError('the redis package is required for shared rooms') from error
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _key(self, code: str):
+        return f"{self.prefix}{code}"
+
+    def _history(self, code: str):
+        return SharedHistory(self.client, self._key(code), self.capacity, code, self.store)
+
+    def _stored(self, code: str):
+        """
+        Whether a dropped room can be brought back from the store, its
+        counter (kept in Redis) or its rows are enough.
+        """
+        return self.store is not None and \
+            (bool(self.client.exists(f"{self._key(code)}:seq")) or self.store.next_seq(code) > 0)
+
+    def __contains__(self, code: str):
+        return bool(self.client.exists(self._key(code))) or self._stored(code)
+
+    def create(self, code: str):
+        """
+        Add an empty room.
+        """
+        self.client.hsetnx(self._key(code), "members", 0)
+
+    def history(self, code: str):
+        """
+        History of the room, None if there is no such room.
+        """
+        key = self._key(code)
+        if self.client.exists(key):
+            return self._history(code)
+        if not self._stored(code):
+            return None
+        # bring a stored room back, other workers may be doing the same;
+        # the counter is only seeded from the store if it is missing
+        history = self._history(code)
+        self.client.set(f"{key}:seq", self.store.next_seq(code), nx=True)
+        history.extend(self.store.page(code, limit=self.capacity))
+        self.client.hsetnx(key, "members", 0)
+        return history
+
+    def join(self, code: str):
+        """
+        Count a new member of the room, returns the number of members,
+        0 if there is no such room.
+
+        Like leave, this runs as a WATCH transaction on the room key, so a
+        join never lands on a room that leave is dropping.
+        """
+        key = self._key(code)
+
+        def count(pipe):
+            members = pipe.hget(key, "members")
+            if members is None:
+                return 0
+            pipe.multi()
+            pipe.hset(key, "members", int(members) + 1)
+            return int(members) + 1
+
+        while True:
+            members = self.client.transaction(count, key, value_from_callable=True)
+            # a dropped room is brought back from the store, if it has one
+            if members or self.history(code) is None:
+                return members
+
+    def leave(self, code: str):
+        """
+        Count a member out, the room is dropped when nobody is left.
+        """
+        key = self._key(code)
+
+        def drop(pipe):
+            members = pipe.hget(key, "members")
+            if members is None:
+                return 0
+            members = int(members) - 1
+            pipe.multi()
+            if members <= 0:
+                # with a store the counter stays, so a restored room never
+                # reuses sequence numbers still queued by another worker
+                pipe.delete(key, f"{key}:messages")
+                if self.store is None:
+                    pipe.delete(f"{key}:seq")
+            else:
+                pipe.hset(key, "members", members)
+            return max(members, 0)
+
+        return self.client.transaction(drop, key, value_from_callable=True)
@@ -4,6 +4,10 @@ that it works on two different keys (public key and private key).
 Public key is given to everyone to encrypt and send messages to a specific user.
 The private key is kept private and used to decrypt the message.
 """
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from math import gcd
 from Crypto.Util import number
 
 
@@ -11,10 +15,21 @@ class RSA:
     """
     RSA algorithm.
     """
-    def __init__(self, exponent: int = 65537) -> None:
+    modulus_bits = 1024
+    # ISO/IEC 7816-4 padding marker for the byte-packed mode
+    pad_marker = b'\x80'
+    # payloads smaller than this (in bytes) are always processed on one core
+    parallel_threshold = 1 << 16
+    # number of blocks a worker gets per submission
+    chunk_size = 16
+
+    def __init__(self, exponent: int = 65537, primes: int = 2, prime_pool=None) -> None:
         self.__n = None
         self.__d = None
+        self.__crt = None
         self.exp = exponent
+        self.primes = self._valid_primes(primes)
+        self.prime_pool = prime_pool
 
     @property
     def encrypt_int(self):
@@ -26,6 +41,24 @@ class RSA:
         """Get d."""
         return self.__d
 
+    @property
+    def private_key(self):
+        """
+        Get private key with precomputed CRT components.
+
+        Returns
+        -------
+        tuple
+            (n, d, p, q, dp, dq, q_inv) where dp = d mod (p - 1),
+            dq = d mod (q - 1) and q_inv = q^-1 mod p. A multi-prime key
+            is followed by (r_i, d_i, t_i) for every additional prime,
+            where d_i = d mod (r_i - 1) and t_i is the inverse of the
+            product of the previous primes mod r_i
+        """
+        if self.__crt is None:
+            return (self.__n, self.__d)
+        return (self.__n, self.__d) + self.__crt
+
     def _valid_exponent(self, value: int):
         """
         Validate exponent.
@@ -43,6 +76,45 @@ class RSA:
             raise TypeError('invalid type, int expected')
         return value
 
+    @staticmethod
+    def _valid_primes(value: int):
+        """
+        Validate number of primes in the modulus.
+
+        Parameters
+        ----------
+        value : int
+            integer
+
+        Returns
+        int
+            value if it is 2, 3 or 4
+        """
+        if not isinstance(value, int):
+            raise TypeError('invalid type, int expected')
+        if value not in (2, 3, 4):
+            raise ValueError('number of primes must be 2, 3 or 4')
+        return value
+
+    @staticmethod
+    def key_primes(private_key: tuple[int]):
+        """
+        Number of primes recorded in the private key.
+
+        Parameters
+        ----------
+        private_key : tuple(int, ...)
+            private key, see `private_key`
+
+        Returns
+        -------
+        int
+            0 for a plain (n, d) key, otherwise the number of primes
+        """
+        if len(private_key) < 7:
+            return 0
+        return 2 + (len(private_key) - 7) // 3
+
     @staticmethod
     def extended_euclidean(a_val: int, b_val: int):
         """
@@ -80,11 +152,34 @@ class RSA:
     def calculate_keys(self):
         """
         Generating public and private keys.
+
+        The modulus is a product of `primes` distinct primes which together
+        have `modulus_bits` bits. Primes are taken from `prime_pool` if it is set.
         """
-        _p = number.getPrime(512)
-        _q = number.getPrime(512)
-        self.__n = _p * _q
-        phi_n = (_p - 1) * (_q - 1)
+        get_prime = number.getPrime if self.prime_pool is None else self.prime_pool.get
+        factors = []
+        product = 1
+        for i in range(self.primes):
+            last = i == self.primes - 1
+            bits = self.modulus_bits // self.primes + (i < self.modulus_bits % self.primes)
+            if last:
+                # the size of the last prime for which a random prime gives a
+                # modulus of exactly modulus_bits bits at least half of the time
+                length = product.bit_length()
+                bits = self.modulus_bits - length + (3 * product < 2 << length)
+            prime = get_prime(bits)
+            while prime in factors or gcd(self.exp, prime - 1) != 1 or \
+                    (last and (product * prime).bit_length() != self.modulus_bits):
+                prime = get_prime(bits)
+            factors.append(prime)
+            product *= prime
+
+        _p, _q = factors[:2]
+        self.__n = 1
+        phi_n = 1
+        for prime in factors:
+            self.__n *= prime
+            phi_n *= prime - 1
 
         # enough large Fermat prime number
         _d = self.extended_euclidean(self.exp, phi_n)[1]
@@ -94,8 +189,114 @@ class RSA:
             _d += phi_n
 
         self.__d = _d
+        crt = (_p, _q, _d % (_p - 1), _d % (_q - 1),
+               self.extended_euclidean(_q, _p)[1] % _p)
+        product = _p * _q
+        for prime in factors[2:]:
+            crt += (prime, _d % (prime - 1),
+                    self.extended_euclidean(product % prime, prime)[1] % prime)
+            product *= prime
+        self.__crt = crt
+
+    @staticmethod
+    def block_sizes(n_val: int):
+        """
+        Byte widths of plaintext and ciphertext blocks in the packed mode.
+
+        Parameters
+        ----------
+        n_val : int
+            modulus
 
-    def encrypt(self, message: str, public_key: tuple[int]):
+        Returns
+        -------
+        tuple
+            plaintext block size (always smaller than n) and
+            ciphertext block size (fits any residue mod n)
+        """
+        return (n_val.bit_length() - 1) // 8, (n_val.bit_length() + 7) // 8
+
+    def pack_blocks(self, message: str, n_val: int):
+        """
+        Encode message as UTF-8 and pack the bytes into integers below n.
+
+        The last block is padded with 0x80 followed by zero bytes.
+
+        Parameters
+        ----------
+        message : str
+            message
+        n_val : int
+            modulus
+
+        Returns
+        -------
+        list
+            plaintext blocks
+        """
+        size = self.block_sizes(n_val)[0]
+        data = message.encode('utf-8') + self.pad_marker
+        data += bytes(-len(data) % size)
+        return [int.from_bytes(data[j : j + size], 'big') for j in range(0, len(data), size)]
+
+    def unpack_blocks(self, blocks: list[int], n_val: int):
+        """
+        Inverse of `pack_blocks`.
+
+        Parameters
+        ----------
+        blocks : list
+            decrypted plaintext blocks
+        n_val : int
+            modulus
+
+        Returns
+        -------
+        str
+            message
+        """
+        size = self.block_sizes(n_val)[0]
+        data = b''.join(block.to_bytes(size, 'big') for block in blocks).rstrip(b'\x00')
+        if not data.endswith(self.pad_marker):
+            raise ValueError('invalid padding')
+        return data[:-len(self.pad_marker)].decode('utf-8')
+
+    def map_blocks(self, func, blocks: list, size: int, workers: int | None = 1,
+                   executor=None):
+        """
+        Apply func to every block, in a process pool for large payloads.
+
+        Parameters
+        ----------
+        func : callable
+            picklable function of one block
+        blocks : list
+            blocks
+        size : int
+            payload size in bytes, compared with `parallel_threshold`
+        workers : int or None
+            number of worker processes, None for os.cpu_count()
+        executor : concurrent.futures.Executor or None
+            pool reused across calls, a pool of `workers` processes
+            is started for this call only if it is not given
+
+        Returns
+        -------
+        list
+            results in the order of blocks
+        """
+        if size < self.parallel_threshold:
+            return [func(block) for block in blocks]
+        if executor is not None:
+            return list(executor.map(func, blocks, chunksize=self.chunk_size))
+        workers = workers or os.cpu_count()
+        if workers <= 1:
+            return [func(block) for block in blocks]
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(func, blocks, chunksize=self.chunk_size))
+
+    def encrypt(self, message: str, public_key: tuple[int], packed: bool = False,
+                workers: int | None = 1, executor=None):
         """
         Ecrypting message.
 
@@ -105,41 +306,115 @@ class RSA:
             message
         public_key : tuple(int, int)
             tuple with two values: n (modulus) and e (exponent)
+        packed : bool
+            if True, UTF-8 bytes are packed directly into blocks filling the
+            modulus and the ciphertext is returned as fixed-width binary blocks,
+            otherwise every character is encoded as 3 decimal digits
+        workers : int or None
+            number of worker processes used for payloads of at least
+            `parallel_threshold` bytes (UTF-8), None for os.cpu_count()
+        executor : concurrent.futures.Executor or None
+            pool reused across calls instead of a new one per call
         
         Returns
         -------
-        str
-            encrypted message
+        str or bytes
+            encrypted message, bytes in the packed mode
         """
         n_val, e_val = public_key
+        encrypt_block = partial(pow, exp=e_val, mod=n_val)
+        size = len(message.encode('utf-8'))
+        if packed:
+            width = self.block_sizes(n_val)[1]
+            blocks = self.map_blocks(encrypt_block, self.pack_blocks(message, n_val),
+                                     size, workers, executor)
+            return b''.join(block.to_bytes(width, 'big') for block in blocks)
         block_size = len(str(n_val)) // 3 - 1
         ascii_str = [('00' + str(ord(char)))[-3:] for char in message]
         ascii_list = []
         for j in range(0, len(ascii_str), block_size):
             ascii_list.append(''.join(ascii_str[j : j + block_size]))
         ascii_list[-1] = ascii_list[-1] + '0' * (block_size * 3 - len(ascii_list[-1]))
-        encrypted_message = [str(pow(int(c), e_val, n_val)) for c in ascii_list]
+        encrypted_message = [str(c) for c in self.map_blocks(
+            encrypt_block, [int(c) for c in ascii_list], size, workers, executor)]
         return ' '.join(encrypted_message)
 
-    def decrypt(self, encrypted_message: str, private_key: tuple[int]):
+    @staticmethod
+    def decrypt_block(block: int, private_key: tuple[int]):
+        """
+        Decrypt a single integer block.
+
+        Uses the Chinese Remainder Theorem when the private key carries
+        p, q, dp, dq and q_inv (plus one (r_i, d_i, t_i) triple per extra
+        prime), otherwise falls back to pow(c, d, n).
+
+        Parameters
+        ----------
+        block : int
+            encrypted block
+        private_key : tuple(int, ...)
+            (n, d), (n, d, p, q, dp, dq, q_inv) or a multi-prime key
+
+        Returns
+        -------
+        int
+            decrypted block
+        """
+        if len(private_key) < 7:
+            n_val, __d = private_key[:2]
+            return pow(block, __d, n_val)
+        _p, _q, d_p, d_q, q_inv = private_key[2:7]
+        m_p = pow(block, d_p, _p)
+        m_q = pow(block, d_q, _q)
+        result = m_q + _q * ((m_p - m_q) * q_inv % _p)
+        product = _p * _q
+        for i in range(7, len(private_key), 3):
+            prime, d_i, t_i = private_key[i : i + 3]
+            m_i = pow(block, d_i, prime)
+            result += product * ((m_i - result) * t_i % prime)
+            product *= prime
+        return result
+
+    def decrypt(self, encrypted_message: str | bytes, private_key: tuple[int],
+                workers: int | None = 1, executor=None):
         """
         Derypting encrypted message.
 
         Parameters
         ----------
-        encrypted_message : str
-            encrypted message
-        private_key : tuple(int, int)
-            tuple with two values: n (modulus) and d (private key)
+        encrypted_message : str or bytes
+            encrypted message, bytes for the packed mode
+            and str for the legacy decimal format
+        private_key : tuple(int, ...)
+            n (modulus) and d (private key), optionally followed by
+            the CRT components p, q, dp, dq and q_inv (see `private_key`)
+        workers : int or None
+            number of worker processes used for payloads of at least
+            `parallel_threshold` bytes, None for os.cpu_count()
+        executor : concurrent.futures.Executor or None
+            pool reused across calls instead of a new one per call
         
         Returns
         -------
         str
             decrypted message
         """
-        n_val, __d = private_key
+        n_val = private_key[0]
+        decrypt_block = partial(RSA.decrypt_block, private_key=private_key)
+        if isinstance(encrypted_message, (bytes, bytearray)):
+            width = self.block_sizes(n_val)[1]
+            if len(encrypted_message) % width:
+                raise ValueError('invalid ciphertext length')
+            blocks = [int.from_bytes(encrypted_message[j : j + width], 'big')
+                      for j in range(0, len(encrypted_message), width)]
+            return self.unpack_blocks(
+                self.map_blocks(decrypt_block, blocks, len(encrypted_message), workers,
+                                executor), n_val)
+
         block_size = len(str(n_val)) // 3 - 1
-        decrypted_message = [str(pow(int(c), __d, n_val)) for c in encrypted_message.split(' ')]
+        decrypted_message = [str(c) for c in self.map_blocks(
+            decrypt_block, [int(c) for c in encrypted_message.split(' ')],
+            len(encrypted_message), workers, executor)]
         result = ""
         for code in decrypted_message:
             code = '0' * (block_size * 3 - len(code)) + code
@@ -148,6 +423,61 @@ class RSA:
                     result += chr(int(code[i : i + 3]))
         return result
 
+    def encrypt_bulk(self, message: str, public_key: tuple[int], workers: int | None = None,
+                     executor=None):
+        """
+        Encrypt a large payload in the packed mode across a process pool.
+
+        Messages shorter than `parallel_threshold` bytes are encrypted
+        on the current core.
+
+        Parameters
+        ----------
+        message : str
+            message
+        public_key : tuple(int, int)
+            n (modulus) and e (exponent)
+        workers : int or None
+            number of worker processes, None for os.cpu_count()
+        executor : concurrent.futures.Executor or None
+            pool reused across calls, so repeated bulk calls do not start
+            worker processes every time
+
+        Returns
+        -------
+        bytes
+            encrypted message
+        """
+        return self.encrypt(message, public_key, packed=True, workers=workers,
+                            executor=executor)
+
+    def decrypt_bulk(self, encrypted_message: str | bytes, private_key: tuple[int],
+                     workers: int | None = None, executor=None):
+        """
+        Decrypt a large payload across a process pool.
+
+        Ciphertexts shorter than `parallel_threshold` bytes are decrypted
+        on the current core.
+
+        Parameters
+        ----------
+        encrypted_message : str or bytes
+            encrypted message in the packed or the legacy format
+        private_key : tuple(int, ...)
+            private key, see `private_key`
+        workers : int or None
+            number of worker processes, None for os.cpu_count()
+        executor : concurrent.futures.Executor or None
+            pool reused across calls, see `encrypt_bulk`
+
+        Returns
+        -------
+        str
+            decrypted message
+        """
+        return self.decrypt(encrypted_message, private_key, workers=workers,
+                            executor=executor)
+
 
 if __name__ == '__main__':
     r_s_a = RSA()
@@ -156,3 +486,13 @@ if __name__ == '__main__':
     E_MES = r_s_a.encrypt(MES, (r_s_a.encrypt_int, r_s_a.exp))
     D_MES = r_s_a.decrypt(E_MES, (r_s_a.encrypt_int, r_s_a.decrypt_int))
     assert MES == D_MES
+    assert MES == r_s_a.decrypt(E_MES, r_s_a.private_key)
+    E_MES = r_s_a.encrypt('Привіт, світе! ✓', (r_s_a.encrypt_int, r_s_a.exp), packed=True)
+    assert r_s_a.decrypt(E_MES, r_s_a.private_key) == 'Привіт, світе! ✓'
+    for count in (3, 4):
+        multi = RSA(primes=count)
+        multi.calculate_keys()
+        E_MES = multi.encrypt(MES, (multi.encrypt_int, multi.exp))
+        assert RSA.key_primes(multi.private_key) == count
+        assert MES == multi.decrypt(E_MES, multi.private_key)
+        assert MES == multi.decrypt(E_MES, (multi.encrypt_int, multi.decrypt_int))
@@ -0,0 +1,214 @@
+"""
+Tests of the shared room state: two messenger workers behind one
+Redis-compatible server (a fakeredis TcpFakeServer) and the join/leave
+race of SharedRooms.
+"""
+import os
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+requests = pytest.importorskip("requests")
+socketio = pytest.importorskip("socketio")
+
+from message_store import MessageStore
+from room_state import SharedRooms
+
+ROOT = Path(__file__).resolve().parent
+WORKER = "import sys, main; main.socketio.run(main.app, port=int(sys.argv[1]), " \
+         "allow_unsafe_werkzeug=True)"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def listening(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+@pytest.fixture
+def redis_url():
+    port = free_port()
+    server = fakeredis.TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{port}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@contextmanager
+def running_workers(redis_url, directory, store=""):
+    env = dict(os.environ, MESSAGE_QUEUE=redis_url, MESSAGE_STORE=store,
+               ASYNC_MODE="threading", PYTHONPATH=str(ROOT))
+    ports = [free_port(), free_port()]
+    processes = [subprocess.Popen([sys.executable, "-c", WORKER, str(port)],
+                                  cwd=directory, env=env, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+                 for port in ports]
+    try:
+        for port in ports:
+            assert wait_for(lambda: listening(port)), "worker did not start"
+        yield [f"http://127.0.0.1:{port}" for port in ports]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(10)
+
+
+@pytest.fixture
+def workers(redis_url, tmp_path):
+    with running_workers(redis_url, tmp_path) as urls:
+        yield urls
+
+
+def enter(url, name, code=None):
+    """
+    Log into a room through the home page, returns the session and the room code.
+    """
+    http = requests.Session()
+    form = {"name": name, "create": "1"} if code is None else \
+        {"name": name, "code": code, "join": "1"}
+    http.post(url + "/", data=form)
+    page = http.get(url + "/room").text
+    return http, re.search(r"Chat Room: <span[^>]*>([^<]+)</span>", page).group(1)
+
+
+def connect(url, http):
+    client = socketio.Client()
+    received = []
+    client.on("message", received.append)
+    client.connect(url, headers={"Cookie": f"session={http.cookies['session']}"},
+                   transports=["polling"])
+    return client, received
+
+
+def test_message_reaches_client_on_other_worker(workers):
+    first, second = workers
+    alice, code = enter(first, "alice")
+    bob, joined = enter(second, "bob", code)
+    assert joined == code
+
+    alice_client, _ = connect(first, alice)
+    bob_client, received = connect(second, bob)
+    try:
+        alice_client.send({"data": "hello from the first worker"})
+        assert wait_for(lambda: any(msg.get("message") == "hello from the first worker"
+                                    for msg in received))
+        message = next(msg for msg in received if "seq" in msg)
+        assert message == {"seq": 0, "name": "alice", "message": "hello from the first worker"}
+    finally:
+        alice_client.disconnect()
+        bob_client.disconnect()
+
+
+def test_room_restored_on_other_worker_keeps_sequence(redis_url, tmp_path):
+    store = tmp_path / "messages.db"
+    redis = fakeredis.FakeRedis.from_url(redis_url)
+    with running_workers(redis_url, tmp_path, str(store)) as (first, second):
+        # hold the write lock, so the messages stay queued on the first worker
+        lock = sqlite3.connect(store, isolation_level=None)
+        lock.execute("BEGIN EXCLUSIVE")
+        alice, code = enter(first, "alice")
+        alice_client, _ = connect(first, alice)
+        for number in range(20):
+            # acknowledged, so every message is handled before the disconnect
+            alice_client.call("message", {"data": f"message {number}"})
+        alice_client.disconnect()
+        # the room is dropped from Redis while its rows are still queued
+        assert wait_for(lambda: not redis.exists(f"messenger:room:{code}"))
+
+        bob, _ = enter(second, "bob", code)
+        bob_client, received = connect(second, bob)
+        try:
+            bob_client.send({"data": "after the restore"})
+            assert wait_for(lambda: any(msg.get("message") == "after the restore"
+                                        for msg in received))
+            assert next(msg for msg in received if "seq" in msg)["seq"] == 20
+        finally:
+            bob_client.disconnect()
+            lock.execute("COMMIT")
+            lock.close()
+
+        def stored():
+            with sqlite3.connect(store) as connection:
+                return connection.execute(
+                    "SELECT seq, message FROM messages WHERE room = ? ORDER BY seq", (code,)
+                ).fetchall()
+
+        assert wait_for(lambda: len(stored()) == 21)
+        assert stored() == [(number, f"message {number}") for number in range(20)] + \
+            [(20, "after the restore")]
+
+
+def test_join_after_last_leave_does_not_restart_room():
+    client = fakeredis.FakeRedis()
+    rooms = SharedRooms(client)
+    rooms.create("room")
+    assert rooms.join("room") == 1
+    rooms.history("room").append("alice", "hi")
+    assert rooms.leave("room") == 0
+
+    # without a store the room is gone, a late join must not recreate part of it
+    assert rooms.join("room") == 0
+    assert rooms.history("room") is None
+    assert client.keys("messenger:room:room*") == []
+
+
+def test_join_after_last_leave_restores_stored_room(tmp_path):
+    store = MessageStore(str(tmp_path / "messages.db"))
+    try:
+        rooms = SharedRooms(fakeredis.FakeRedis(), store=store)
+        rooms.create("room")
+        rooms.join("room")
+        for number in range(3):
+            rooms.history("room").append("alice", f"message {number}")
+        rooms.leave("room")
+
+        assert rooms.join("room") == 1
+        assert rooms.history("room").append("bob", "after").seq == 3
+    finally:
+        store.close()
+
+
+def test_concurrent_join_and_leave_keep_the_room():
+    client = fakeredis.FakeRedis()
+    rooms = SharedRooms(client)
+    rooms.create("room")
+    rooms.join("room")
+    rooms.history("room").append("alice", "hi")
+
+    def churn():
+        for _ in range(50):
+            assert rooms.join("room") >= 2
+            rooms.leave("room")
+
+    threads = [threading.Thread(target=churn) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert int(client.hget("messenger:room:room", "members")) == 1
+    assert rooms.history("room").next_seq == 1